@@ -3,8 +3,12 @@ load_dotenv()
 
 import utils.setup_logging
 from utils.interface import create_interface
+from utils.sinks import StdoutSink
 
 
 if __name__ == '__main__':
+    # если формат stdout включен оператором - до запуска интерфейса, чтобы баннер gradio не попадал в JSON Lines
+    if StdoutSink.is_enabled():
+        StdoutSink.reserve_stdout()
     interface = create_interface()
     interface.launch()
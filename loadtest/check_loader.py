@@ -0,0 +1,80 @@
+'''
+Проверка загрузчика utils.loader на больших экспортах: многострочный текст, пропуски id, несколько блоков чтения
+
+Пример запуска из корня репозитория:
+    python -m loadtest.check_loader --messages 200000
+Код возврата 1, если load_export и iter_export вернули разные данные
+'''
+import argparse
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from utils.loader import iter_export, load_export
+from utils.parser import Parser
+from utils.sinks import ResultsDir
+
+
+def make_message_dicts(message_count: int) -> list[dict]:
+    created_at = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    message_dicts = []
+    for message_id in range(1, message_count + 1):
+        message_dicts.append({
+            'date': created_at + timedelta(minutes=message_id),
+            'chat_type': 'Channel',
+            'chat_name': 'check_loader',
+            'chat_id': 1001,
+            'message_id': message_id,
+            'sender_type': 'User' if message_id % 10 else 'Channel',
+            'sender_username': f'user_{message_id % 100}' if message_id % 3 else None,
+            'sender_first_name': 'Check',
+            'sender_last_name': None,
+            # id больше 2 ** 53, чтобы потеря точности при чтении через float была заметна
+            'sender_id': 2 ** 60 + message_id if message_id % 10 else None,
+            'text': f'line one of message {message_id}\nline two, "quoted", with comma',
+            'edit_date': created_at + timedelta(minutes=message_id, seconds=30) if message_id % 7 == 0 else None,
+        })
+    return message_dicts
+
+
+def check_csv(message_count: int) -> list[str]:
+    errors = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        ResultsDir.path = Path(work_dir)
+        csv_path = Parser.messages_to_csv(make_message_dicts(message_count))
+        print(f'CSV: {csv_path.stat().st_size / 1024 ** 2:.1f} МБ, сообщений {message_count}')
+
+        df = load_export(csv_path)
+        chunked_df = pd.concat(iter_export(csv_path, chunksize=50_000), ignore_index=True)
+        for name, frame in (('load_export', df), ('iter_export', chunked_df)):
+            if len(frame) != message_count:
+                errors.append(f'{name}: прочитано {len(frame)} строк вместо {message_count}')
+            elif not frame['text'].str.contains('\n').all():
+                errors.append(f'{name}: переводы строк в тексте потеряны')
+            elif frame['sender_id'].dtype != 'Int64' or frame['sender_id'].max() != 2 ** 60 + message_count - 1:
+                errors.append(f'{name}: sender_id прочитан неточно ({frame["sender_id"].dtype})')
+        if not errors:
+            try:
+                pd.testing.assert_frame_equal(df, chunked_df, check_categorical=False)
+            except AssertionError as ex:
+                errors.append(f'load_export и iter_export вернули разные данные: {ex}')
+    return errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Проверка загрузчика экспортов на больших файлах')
+    parser.add_argument('--messages', type=int, default=200_000, help='Кол-во сообщений в проверочном экспорте')
+    args = parser.parse_args()
+
+    errors = check_csv(args.messages)
+    for error in errors:
+        print(error)
+    print('Ошибок нет' if not errors else f'Ошибок: {len(errors)}')
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
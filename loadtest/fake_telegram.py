@@ -0,0 +1,217 @@
+import asyncio
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from telethon import errors, types
+from telethon.sessions.abstract import Session
+
+
+WORDS = [
+    'telegram', 'parser', 'message', 'channel', 'group', 'python', 'data', 'news',
+    'release', 'update', 'model', 'dataset', 'question', 'answer', 'link', 'photo',
+]
+
+
+@dataclass
+class FakeTelegramBackend:
+    '''Локальная имитация Telegram API: синтетические чаты, задержки запросов и FloodWaitError'''
+    chat_sizes: list[int] = field(default_factory=lambda: [1000])
+    latency: float = 0.05
+    latency_jitter: float = 0.02
+    flood_wait_rate: float = 0.0
+    flood_wait_seconds: int = 1
+    # как в Telethon: FloodWait до этого порога клиент пережидает сам, больше - выбрасывает ошибку
+    flood_sleep_threshold: int = 60
+    messages_per_request: int = 100
+    seed: int = 0
+
+    def __post_init__(self):
+        self.random = random.Random(self.seed)
+        self.authorized_sessions: set[int] = set()
+        self.requests_count = 0
+        self.flood_waits_count = 0
+        self.sender = types.User(id=1, first_name='Load', last_name='Test', username='loadtest_user', access_hash=1)
+        self.chats: dict[int, types.Channel] = {}
+        self.usernames: dict[str, int] = {}
+        self.message_counts: dict[int, int] = {}
+        created_at = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        for i, chat_size in enumerate(self.chat_sizes, start=1):
+            chat_id = 1000 + i
+            username = f'loadtest_chat_{i}'
+            self.chats[chat_id] = types.Channel(
+                id=chat_id,
+                title=f'Load test chat {i}',
+                photo=types.ChatPhotoEmpty(),
+                date=created_at,
+                access_hash=chat_id,
+                username=username,
+                megagroup=True,
+            )
+            self.usernames[username] = chat_id
+            self.message_counts[chat_id] = chat_size
+
+    @property
+    def chat_usernames(self) -> list[str]:
+        return list(self.usernames)
+
+    def get_client(self, session: Session, api_id: str, api_hash: str, **kwargs) -> 'FakeTelegramClient':
+        return FakeTelegramClient(self, session)
+
+    async def request(self) -> None:
+        self.requests_count += 1
+        delay = max(0.0, self.latency + self.random.uniform(-self.latency_jitter, self.latency_jitter))
+        await asyncio.sleep(delay)
+        if self.flood_wait_rate and self.random.random() < self.flood_wait_rate:
+            self.flood_waits_count += 1
+            if self.flood_wait_seconds > self.flood_sleep_threshold:
+                raise errors.FloodWaitError(request=None, capture=self.flood_wait_seconds)
+            await asyncio.sleep(self.flood_wait_seconds)
+
+    def resolve_chat_id(self, entity) -> int:
+        if isinstance(entity, str):
+            username = entity.strip().split('/')[-1].lstrip('@')
+            if username.lstrip('-').isdigit():
+                return int(username)
+            if username not in self.usernames:
+                raise errors.UsernameNotOccupiedError(request=None)
+            return self.usernames[username]
+        for attr in ('id', 'channel_id', 'chat_id', 'user_id'):
+            if hasattr(entity, attr):
+                return getattr(entity, attr)
+        raise ValueError(f'Неизвестная сущность {entity}')
+
+    def make_message(self, chat_id: int, message_id: int) -> 'FakeMessage':
+        text_random = random.Random(chat_id * 1_000_003 + message_id)
+        text = ' '.join(text_random.choices(WORDS, k=text_random.randint(3, 30)))
+        date = self.chats[chat_id].date + timedelta(minutes=message_id)
+        return FakeMessage(message_id, text, date, self.sender, self.chats[chat_id])
+
+
+@dataclass
+class FakeMessage:
+    id: int
+    message: str
+    date: datetime
+    sender: types.User
+    _chat: types.Channel
+    edit_date: datetime | None = None
+
+    @property
+    def text(self) -> str:
+        return self.message
+
+    @property
+    def _sender_id(self) -> int:
+        return self.sender.id
+
+    async def get_chat(self) -> types.Channel:
+        return self._chat
+
+    async def get_sender(self) -> types.User:
+        return self.sender
+
+
+class FakeTotalList(list):
+    def __init__(self, total: int = 0):
+        super().__init__()
+        self.total = total
+
+
+class FakeTelegramClient:
+    '''Подмена TelegramClient с методами, которые использует приложение'''
+
+    def __init__(self, backend: FakeTelegramBackend, session: Session):
+        self.backend = backend
+        self.session = session
+        self.connected = False
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    async def connect(self) -> None:
+        await self.backend.request()
+        self.connected = True
+
+    async def disconnect(self) -> None:
+        self.connected = False
+
+    async def __aenter__(self) -> 'FakeTelegramClient':
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.disconnect()
+
+    async def is_user_authorized(self) -> bool:
+        await self.backend.request()
+        return id(self.session) in self.backend.authorized_sessions
+
+    async def send_code_request(self, phone_number: str) -> None:
+        await self.backend.request()
+
+    async def sign_in(self, phone: str | None = None, code: str | None = None, password: str | None = None) -> None:
+        await self.backend.request()
+        self.backend.authorized_sessions.add(id(self.session))
+
+    async def log_out(self) -> None:
+        await self.backend.request()
+        self.backend.authorized_sessions.discard(id(self.session))
+
+    async def get_entity(self, entity) -> types.Channel:
+        await self.backend.request()
+        return self.backend.chats[self.backend.resolve_chat_id(entity)]
+
+    async def get_messages(self, entity, limit: int | None = None, **kwargs) -> FakeTotalList:
+        await self.backend.request()
+        chat_id = self.backend.resolve_chat_id(entity)
+        message_count = self.backend.message_counts[chat_id]
+        messages = FakeTotalList(total=message_count)
+        for message_id in range(message_count, max(0, message_count - (limit or 0)), -1):
+            messages.append(self.backend.make_message(chat_id, message_id))
+        return messages
+
+    async def iter_messages(
+        self,
+        entity,
+        limit: int | None = None,
+        offset_date=None,
+        reverse: bool = False,
+        offset_id: int = 0,
+        min_id: int = 0,
+        **kwargs,
+        ):
+        chat_id = self.backend.resolve_chat_id(entity)
+        message_count = self.backend.message_counts[chat_id]
+        if reverse:
+            message_ids = range(max(offset_id, min_id) + 1, message_count + 1)
+        else:
+            first_id = offset_id - 1 if offset_id else message_count
+            message_ids = range(first_id, min_id, -1)
+        if limit is not None:
+            message_ids = message_ids[:int(limit)]
+        for i, message_id in enumerate(message_ids):
+            if i % self.backend.messages_per_request == 0:
+                await self.backend.request()
+            yield self.backend.make_message(chat_id, message_id)
+
+    async def iter_dialogs(self, **kwargs):
+        await self.backend.request()
+        for chat in self.backend.chats.values():
+            yield FakeDialog(chat)
+
+    def add_event_handler(self, callback, event) -> None:
+        pass
+
+    def remove_event_handler(self, callback, event) -> None:
+        pass
+
+
+class FakeDialog:
+    def __init__(self, chat: types.Channel):
+        self.entity = chat
+        self.id = chat.id
+        self.archived = False
+        self.is_user = False
+        self.is_group = True
+        self.is_channel = True
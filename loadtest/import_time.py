@@ -0,0 +1,110 @@
+'''
+Замер времени холодного старта: импорт utils.interface и создание интерфейса, с проверкой бюджета
+
+Пример запуска из корня репозитория:
+    python -m loadtest.import_time --runs 5 --budget 6 --own-budget 0.2
+Код возврата 1, если медиана превышает бюджет или при старте импортируются модули из --lazy-modules
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+# замер в отдельном процессе, чтобы модули не были уже импортированы
+STARTUP_CODE = '''
+import json, sys, time
+started_at = time.perf_counter()
+from utils.interface import create_interface
+imported_at = time.perf_counter()
+create_interface()
+created_at = time.perf_counter()
+print(json.dumps({
+    'import_sec': imported_at - started_at,
+    'create_interface_sec': created_at - imported_at,
+    'modules': sorted(sys.modules),
+}))
+'''
+
+
+def parse_importtime(stderr: str) -> dict[str, float]:
+    '''Собственное время импорта (self, без вложенных импортов) по пакетам верхнего уровня, секунды'''
+    package_times = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, module = line.removeprefix('import time:').split('|')
+        package_times[module.strip().split('.')[0]] += int(self_us) / 1e6
+    return package_times
+
+
+def measure_startup() -> dict:
+    with tempfile.TemporaryDirectory() as work_dir:
+        env = dict(os.environ, PYTHONPATH=str(REPO_DIR))
+        for env_var in ('API_ID', 'API_HASH', 'PHONE_NUMBER'):
+            env.pop(env_var, None)
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_CODE],
+            cwd=work_dir, env=env, capture_output=True, text=True, check=True,
+        )
+    startup = json.loads(result.stdout.strip().splitlines()[-1])
+    startup['package_times'] = parse_importtime(result.stderr)
+    return startup
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Проверка бюджета времени холодного старта приложения')
+    parser.add_argument('--runs', type=int, default=3, help='Кол-во замеров, сравнивается медиана')
+    parser.add_argument('--budget', type=float, default=6.0,
+                        help='Бюджет на импорт и создание интерфейса, сек')
+    parser.add_argument('--own-budget', type=float, default=0.2,
+                        help='Бюджет на собственное время импорта модулей utils, сек')
+    parser.add_argument('--lazy-modules', default='utils.loader',
+                        help='Модули через запятую, которые не должны импортироваться при старте')
+    parser.add_argument('--top', type=int, default=10, help='Сколько самых медленных пакетов показать')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    startups = [measure_startup() for _ in range(args.runs)]
+    startup_times = [startup['import_sec'] + startup['create_interface_sec'] for startup in startups]
+    import_times = [startup['import_sec'] for startup in startups]
+    create_times = [startup['create_interface_sec'] for startup in startups]
+    package_times = defaultdict(list)
+    for startup in startups:
+        for package, package_time in startup['package_times'].items():
+            package_times[package].append(package_time)
+    package_medians = {package: statistics.median(times) for package, times in package_times.items()}
+
+    startup_time = statistics.median(startup_times)
+    own_time = package_medians.get('utils', 0.0)
+    print(f'Холодный старт (медиана из {args.runs}): {startup_time:.3f} сек, бюджет {args.budget} сек')
+    print(f'Импорт: {statistics.median(import_times):.3f} сек, create_interface: {statistics.median(create_times):.3f} сек')
+    print(f'Собственные модули utils: {own_time:.3f} сек, бюджет {args.own_budget} сек')
+    print('Самые медленные пакеты (собственное время импорта):')
+    for package, package_time in sorted(package_medians.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f'    {package:<24}{package_time:>8.3f} сек')
+
+    errors = []
+    if startup_time > args.budget:
+        errors.append(f'Превышен бюджет холодного старта: {startup_time:.3f} > {args.budget} сек')
+    if own_time > args.own_budget:
+        errors.append(f'Превышен бюджет импорта модулей utils: {own_time:.3f} > {args.own_budget} сек')
+    lazy_modules = [module for module in args.lazy_modules.split(',') if module]
+    for module in lazy_modules:
+        if any(module in startup['modules'] for startup in startups):
+            errors.append(f'Модуль {module} импортируется при старте, хотя должен импортироваться при первом использовании')
+    for error in errors:
+        print(error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+'''
+Нагрузочное тестирование интерфейса create_interface на локальной имитации Telegram
+
+Пример запуска из корня репозитория:
+    python -m loadtest.run --users 20 --chat-sizes 2000,10000 --latency 0.05 --flood-wait-rate 0.01
+'''
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from gradio_client import Client
+
+from loadtest.fake_telegram import FakeTelegramBackend
+from utils.auth import ClientConnector
+from utils.interface import create_interface
+
+
+@dataclass
+class UserResult:
+    step_times: dict[str, float] = field(default_factory=dict)
+    error: str | None = None
+    flow_time: float = 0.0
+
+
+class MemoryMonitor:
+    '''Периодический замер RSS процесса, в котором работают сервер и имитация Telegram'''
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.samples: list[float] = []
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    @staticmethod
+    def get_rss_mb() -> float:
+        status_path = Path('/proc/self/status')
+        if status_path.is_file():
+            for line in status_path.read_text().splitlines():
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+        # ru_maxrss в КБ на Linux и в байтах на macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss / 1024 ** 2 if sys.platform == 'darwin' else max_rss / 1024
+
+    def run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            self.samples.append(self.get_rss_mb())
+
+    def __enter__(self) -> 'MemoryMonitor':
+        self.samples.append(self.get_rss_mb())
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop_event.set()
+        self.thread.join()
+        self.samples.append(self.get_rss_mb())
+
+
+def percentile(values: list[float], percent: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[int(percent) - 1]
+
+
+def run_user(url: str, user_index: int, args: argparse.Namespace, chat_usernames: list[str]) -> UserResult:
+    result = UserResult()
+    started_at = time.perf_counter()
+
+    def step(name: str, *predict_args, api_name: str):
+        step_started_at = time.perf_counter()
+        output = client.predict(*predict_args, api_name=api_name)
+        result.step_times[name] = time.perf_counter() - step_started_at
+        return output
+
+    try:
+        client = Client(url, verbose=False)
+        step('session_type', 'memory', api_name='/update_auth_state_session_type')
+        step('start_auth', args.api_id, args.api_hash, api_name='/start_auth')
+        step('send_code', args.phone_number, api_name='/send_code')
+        step('verify_code', args.phone_number, '12345', api_name='/verify_code')
+        step('add_chats', ' '.join(chat_usernames), args.api_id, args.api_hash, api_name='/add_chat_to_chats_list')
+        parse_status = step(
+            'parse', args.api_id, args.api_hash, args.export_formats, False, args.limit, None, False,
+            api_name='/parse_chats',
+        )
+        if 'Успешный парсинг' not in str(parse_status):
+            raise RuntimeError(f'Парсинг не выполнен: {parse_status}')
+        step('download', api_name='/update_download_btn')
+    except Exception as ex:
+        result.error = f'user {user_index}: {ex}'
+    result.flow_time = time.perf_counter() - started_at
+    return result
+
+
+def build_report(
+    results: list[UserResult],
+    wall_time: float,
+    memory_samples: list[float],
+    backend: FakeTelegramBackend,
+    args: argparse.Namespace,
+    ) -> dict:
+
+    step_times = defaultdict(list)
+    for result in results:
+        for step_name, step_time in result.step_times.items():
+            step_times[step_name].append(step_time)
+    completed = [result for result in results if result.error is None]
+    flow_times = [result.flow_time for result in completed]
+    if flow_times:
+        step_times['flow'] = flow_times
+
+    messages_per_user = sum(
+        min(chat_size, args.limit) if args.limit else chat_size
+        for chat_size in backend.chat_sizes
+    )
+    report = {
+        'users': args.users,
+        'completed': len(completed),
+        'errors': [result.error for result in results if result.error is not None],
+        'wall_time_sec': round(wall_time, 3),
+        'throughput_flows_per_sec': round(len(completed) / wall_time, 3),
+        'throughput_messages_per_sec': round(len(completed) * messages_per_user / wall_time, 1),
+        'telegram_requests': backend.requests_count,
+        'flood_waits': backend.flood_waits_count,
+        'memory_rss_mb': {
+            'start': round(memory_samples[0], 1),
+            'peak': round(max(memory_samples), 1),
+            'end': round(memory_samples[-1], 1),
+        },
+        'latency_sec': {
+            step_name: {
+                'count': len(values),
+                'mean': round(statistics.fmean(values), 3),
+                'p50': round(percentile(values, 50), 3),
+                'p95': round(percentile(values, 95), 3),
+                'p99': round(percentile(values, 99), 3),
+            }
+            for step_name, values in step_times.items()
+        },
+    }
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f'Пользователей: {report["users"]}, успешно: {report["completed"]}, ошибок: {len(report["errors"])}')
+    print(f'Общее время: {report["wall_time_sec"]} сек')
+    print(
+        f'Пропускная способность: {report["throughput_flows_per_sec"]} сценариев/сек, '
+        f'{report["throughput_messages_per_sec"]} сообщений/сек'
+    )
+    print(f'Запросов к имитации Telegram: {report["telegram_requests"]}, FloodWait: {report["flood_waits"]}')
+    memory = report['memory_rss_mb']
+    print(f'RSS, МБ: старт {memory["start"]}, пик {memory["peak"]}, конец {memory["end"]}')
+    print(f'{"шаг":<14}{"count":>7}{"mean":>9}{"p50":>9}{"p95":>9}{"p99":>9}')
+    for step_name, latency in report['latency_sec'].items():
+        print(
+            f'{step_name:<14}{latency["count"]:>7}{latency["mean"]:>9}'
+            f'{latency["p50"]:>9}{latency["p95"]:>9}{latency["p99"]:>9}'
+        )
+    for error in report['errors'][:10]:
+        print(error)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Нагрузочный тест парсера на имитации Telegram')
+    parser.add_argument('--users', type=int, default=10, help='Кол-во одновременных пользователей')
+    parser.add_argument('--chat-sizes', default='1000,5000', help='Размеры синтетических чатов через запятую')
+    parser.add_argument('--limit', type=int, default=None, help='limit парсинга для каждого чата')
+    parser.add_argument('--export-formats', default='csv', help='Форматы экспорта через запятую')
+    parser.add_argument('--latency', type=float, default=0.05, help='Задержка одного запроса к Telegram, сек')
+    parser.add_argument('--latency-jitter', type=float, default=0.02, help='Разброс задержки, сек')
+    parser.add_argument('--flood-wait-rate', type=float, default=0.0, help='Доля запросов с FloodWaitError')
+    parser.add_argument('--flood-wait-seconds', type=int, default=1, help='Длительность FloodWait, сек')
+    parser.add_argument('--concurrency-limit', type=int, default=None,
+                        help='default_concurrency_limit очереди Gradio, по умолчанию как в app.py')
+    parser.add_argument('--port', type=int, default=7861)
+    parser.add_argument('--report', type=Path, default=None, help='Путь для сохранения отчета в JSON')
+    args = parser.parse_args()
+    args.export_formats = args.export_formats.split(',')
+    args.api_id, args.api_hash, args.phone_number = '1', 'loadtest', '+70000000000'
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    for env_var in ('API_ID', 'API_HASH', 'PHONE_NUMBER'):
+        os.environ.pop(env_var, None)
+    # парсер делает паузу 2 раза по 1 сек на каждую 1000 сообщений, для синтетических чатов она оставлена как есть
+    backend = FakeTelegramBackend(
+        chat_sizes=[int(chat_size) for chat_size in args.chat_sizes.split(',')],
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        flood_wait_rate=args.flood_wait_rate,
+        flood_wait_seconds=args.flood_wait_seconds,
+    )
+    ClientConnector.get_client = staticmethod(backend.get_client)
+
+    interface = create_interface()
+    if args.concurrency_limit is not None:
+        interface.queue(default_concurrency_limit=args.concurrency_limit)
+    interface.launch(prevent_thread_lock=True, server_port=args.port, quiet=True)
+    url = f'http://127.0.0.1:{args.port}/'
+
+    try:
+        with MemoryMonitor() as memory_monitor, ThreadPoolExecutor(max_workers=args.users) as executor:
+            started_at = time.perf_counter()
+            futures = [
+                executor.submit(run_user, url, i, args, backend.chat_usernames)
+                for i in range(args.users)
+            ]
+            results = [future.result() for future in futures]
+            wall_time = time.perf_counter() - started_at
+    finally:
+        interface.close()
+
+    report = build_report(results, wall_time, memory_monitor.samples, backend, args)
+    print_report(report)
+    if args.report is not None:
+        args.report.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,10 @@
 import asyncio
 import os
 import logging
+import threading
+from concurrent.futures import Future
 from dataclasses import dataclass
+from typing import ClassVar
 
 from pathlib import Path
 
@@ -23,8 +26,13 @@ class AuthState:
     need_send_code: bool = False
     need_verify_code: bool = False
     need_verify_2fa: bool = False
+    is_start_auth_checking: bool = False
     message: str | None = None
     client: TelegramClient | None = None
+    # id аккаунта Telegram, к которому привязаны сохраненные наборы чатов
+    user_id: int | None = None
+    # фоновая проверка сохраненной сессии при запуске приложения, общая для всех пользователей
+    start_auth_check: ClassVar[Future | None] = None
 
     def __post_init__(self):
         self.session_dir = Path('sessions')
@@ -35,6 +43,22 @@ class AuthState:
         asyncio.set_event_loop(loop)
         loop.run_until_complete(self.check_is_auth())
 
+    @classmethod
+    def start_auth_status_check(cls) -> None:
+        '''Проверка сохраненной сессии в фоновом потоке, чтобы интерфейс запускался не дожидаясь подключения к Telegram'''
+        start_auth_state = cls()
+        future = Future()
+        cls.start_auth_check = future
+
+        def check() -> None:
+            try:
+                start_auth_state.check_start_auth_status()
+            except Exception as ex:
+                start_auth_state.set_auth_failed(f'Ошибка при проверке сохраненной сессии, код ошибки: {ex}')
+            future.set_result(start_auth_state)
+
+        threading.Thread(target=check, name='start-auth-check', daemon=True).start()
+
     async def check_is_auth(self) -> None:
         if Validator.validate_env_vars().is_valid:
             client = ClientConnector.get_client(self.get_session(), os.getenv('API_ID'), os.getenv('API_HASH'))
@@ -54,6 +78,7 @@ class AuthState:
     def change_session_type(self, session_type):
         if session_type != self.session_type:
             self.session_type = session_type
+            self.user_id = None
 
     def reset_state(self) -> None:
         defaults = self.__class__()
@@ -62,8 +87,10 @@ class AuthState:
         self.need_send_code = defaults.need_send_code
         self.need_verify_code = defaults.need_verify_code
         self.need_verify_2fa = defaults.need_verify_2fa
+        self.is_start_auth_checking = defaults.is_start_auth_checking
         self.message = defaults.message
         self.client = defaults.client
+        self.user_id = defaults.user_id
 
     def _log(self) -> None:
         if self.is_logging and self.message:
@@ -74,6 +101,22 @@ class AuthState:
             self.message = message
         self._log()
 
+    def set_start_auth_check(self) -> None:
+        self.is_start_auth_checking = True
+        self.message = 'Проверка сохраненной сессии'
+
+    def apply_start_auth_status(self, start_auth_state: 'AuthState') -> None:
+        # пользователь мог начать авторизацию или сменить тип сессии до завершения фоновой проверки
+        if not self.is_start_auth_checking:
+            return
+        self.is_start_auth_checking = False
+        if self.session_type != start_auth_state.session_type:
+            self.message = None
+        elif start_auth_state.is_auth:
+            self.set_auth_success()
+        else:
+            self.message = start_auth_state.message
+
     def set_start_auth(self) -> None:
         self.reset_state()
         self.message = 'Начата процедура аутентификации'
@@ -137,6 +180,31 @@ class ClientConnector:
         if client.is_connected():
             await client.disconnect()
 
+    @classmethod
+    async def get_user_id(
+        cls,
+        state: AuthState,
+        api_id: str,
+        api_hash: str,
+        client: TelegramClient | None = None,
+        ) -> int:
+        '''id аккаунта сессии, client - уже подключенный и авторизованный клиент, чтобы не подключаться повторно'''
+        if state.user_id is not None:
+            return state.user_id
+        if client is not None:
+            me = await client.get_me(input_peer=True)
+        else:
+            client = cls.get_client(state.get_session(), api_id, api_hash)
+            try:
+                validation_result = await Validator.validate_auth(client)
+                if not validation_result.is_valid:
+                    raise ValueError(validation_result.message or 'Клиент не авторизован')
+                me = await client.get_me(input_peer=True)
+            finally:
+                await cls.disconnect(client)
+        state.user_id = me.user_id
+        return state.user_id
+
     @classmethod
     async def log_out(cls, client: TelegramClient) -> None:
         await cls.connect(client)
@@ -0,0 +1,162 @@
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import ClassVar, Iterator
+
+from telethon import types
+
+
+@dataclass
+class Chat:
+    chat: types.TLObject
+    chat_name: str | None
+    chat_username: str
+    chat_type: str
+    chat_id: int
+    peer_type: str = 'channel'
+    access_hash: int | None = None
+
+    @classmethod
+    def from_telethon_chat(cls, chat: types.TLObject, chat_username: str):
+        chat_id = chat.id
+        access_hash = getattr(chat, 'access_hash', None)
+        if isinstance(chat, types.User):
+            chat_type = 'Chat'
+            chat_name = f'{chat.first_name} {chat.last_name}'
+            peer_type = 'user'
+        else:
+            chat_type = 'Channel/Group'
+            chat_name = chat.title
+            peer_type = 'channel' if isinstance(chat, (types.Channel, types.ChannelForbidden)) else 'chat'
+        return cls(chat, chat_name, chat_username, chat_type, chat_id, peer_type, access_hash)
+
+    @classmethod
+    def from_dict(cls, chat_dict: dict):
+        chat_id = chat_dict['chat_id']
+        access_hash = chat_dict.get('access_hash')
+        peer_type = chat_dict['peer_type']
+        if peer_type == 'user':
+            chat = types.InputPeerUser(user_id=chat_id, access_hash=access_hash)
+        elif peer_type == 'channel':
+            chat = types.InputPeerChannel(channel_id=chat_id, access_hash=access_hash)
+        else:
+            chat = types.InputPeerChat(chat_id=chat_id)
+        return cls(
+            chat=chat,
+            chat_name=chat_dict['chat_name'],
+            chat_username=chat_dict['chat_username'],
+            chat_type=chat_dict['chat_type'],
+            chat_id=chat_id,
+            peer_type=peer_type,
+            access_hash=access_hash,
+        )
+
+    def to_dict(self) -> dict:
+        chat_dict = {
+            'chat_id': self.chat_id,
+            'access_hash': self.access_hash,
+            'peer_type': self.peer_type,
+            'chat_name': self.chat_name,
+            'chat_username': self.chat_username,
+            'chat_type': self.chat_type,
+        }
+        return chat_dict
+
+    def get_chat_info(self) -> str:
+        chat_info = f'Chat name: {self.chat_name}, Chat type: {self.chat_type}, Chat ID: {self.chat_id}'
+        return chat_info
+
+
+@dataclass
+class ChatRegistry:
+    '''
+    Список чатов для парсинга с индексом по chat_id и сохранением наборов чатов на диск
+    Наборы хранятся отдельно для каждого аккаунта: access_hash чатов действителен только для аккаунта, который их получил
+    '''
+    chats: dict[int, Chat] = field(default_factory=dict)
+    usernames: dict[str, int] = field(default_factory=dict)
+    chat_sets_dir: ClassVar[Path] = Path('chat_sets')
+
+    @staticmethod
+    def normalize_username(chat_username: str) -> str:
+        chat_username = chat_username.strip().lower()
+        chat_username = re.sub(r'^(https?://)?(www\.)?(t|telegram)\.me/', '', chat_username)
+        return chat_username.lstrip('@').rstrip('/')
+
+    def __len__(self) -> int:
+        return len(self.chats)
+
+    def __iter__(self) -> Iterator[Chat]:
+        return iter(self.chats.values())
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self.chats
+
+    def find(self, chat_username: str) -> Chat | None:
+        username = self.normalize_username(chat_username)
+        chat_id = self.usernames.get(username)
+        if chat_id is None and username.lstrip('-').isdigit():
+            chat_id = int(username)
+        return self.chats.get(chat_id)
+
+    def add(self, chat: Chat) -> bool:
+        if chat.chat_id in self.chats:
+            return False
+        self.chats[chat.chat_id] = chat
+        self.usernames[self.normalize_username(chat.chat_username)] = chat.chat_id
+        return True
+
+    def remove(self, chat_id: int) -> None:
+        chat = self.chats.pop(chat_id, None)
+        if chat is not None:
+            self.usernames.pop(self.normalize_username(chat.chat_username), None)
+
+    def clear(self) -> None:
+        self.chats.clear()
+        self.usernames.clear()
+
+    @classmethod
+    def get_owner_dir(cls, owner_id: int) -> Path:
+        return cls.chat_sets_dir / str(int(owner_id))
+
+    @classmethod
+    def get_chat_set_path(cls, name: str, owner_id: int) -> Path:
+        name = name.strip()
+        if not re.fullmatch(r'[\w\- ]+', name):
+            raise ValueError(f'Недопустимое имя набора чатов: {name}')
+        return cls.get_owner_dir(owner_id) / f'{name}.json'
+
+    @classmethod
+    def list_chat_sets(cls, owner_id: int) -> list[str]:
+        return sorted(path.stem for path in cls.get_owner_dir(owner_id).glob('*.json'))
+
+    def save(self, name: str, owner_id: int) -> Path:
+        chat_set_path = self.get_chat_set_path(name, owner_id)
+        chat_set_path.parent.mkdir(parents=True, exist_ok=True)
+        chat_set = {'owner_id': owner_id, 'chats': [chat.to_dict() for chat in self]}
+        tmp_path = chat_set_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(chat_set, file, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, chat_set_path)
+        return chat_set_path
+
+    @classmethod
+    def load(cls, name: str, owner_id: int) -> 'ChatRegistry':
+        chat_set_path = cls.get_chat_set_path(name, owner_id)
+        with open(chat_set_path, encoding='utf-8') as file:
+            chat_set = json.load(file)
+        if not isinstance(chat_set, dict) or chat_set.get('owner_id') != owner_id:
+            raise ValueError(f'Набор чатов {name} сохранен другим аккаунтом')
+        registry = cls()
+        for chat_dict in chat_set['chats']:
+            registry.add(Chat.from_dict(chat_dict))
+        return registry
+
+    @classmethod
+    def delete_chat_set(cls, name: str, owner_id: int) -> None:
+        cls.get_chat_set_path(name, owner_id).unlink(missing_ok=True)
+
+
+ChatRegistry.chat_sets_dir.mkdir(exist_ok=True)
@@ -0,0 +1,202 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Collection, Iterator
+from uuid import uuid4
+
+from utils.sinks import DATE_FIELDS, MESSAGE_DICT, ResultsDir
+
+
+class ChatCheckpoint:
+    '''
+    Промежуточные результаты парсинга чата: сообщения сохраняются атомарно записанными частями в JSON Lines,
+    а в progress.json хранится последний обработанный offset_id, с которого парсинг продолжается после ошибки
+    '''
+    checkpoints_dirname = '.partial'
+    progress_filename = 'progress.json'
+    # сколько сообщений накапливается в памяти до записи очередной части
+    chunk_size = 5000
+    # через сколько секунд после начала парсинга сохраненные части устаревают и парсинг начинается заново
+    max_age_sec = 24 * 60 * 60
+    # каталоги частей, занятые текущими задачами, чтобы одновременные задачи по одному чату не смешивали части
+    active_dirpaths: set[Path] = set()
+    active_lock = threading.Lock()
+
+    def __init__(self, chat_id: int, parse_kwargs: dict[str, Any]):
+        self.chat_id = chat_id
+        self.parse_kwargs = json.loads(json.dumps(parse_kwargs, sort_keys=True, default=str))
+        kwargs_hash = hashlib.sha1(json.dumps(self.parse_kwargs, sort_keys=True).encode()).hexdigest()[:12]
+        dirpath = self.get_checkpoints_dir() / f'{chat_id}_{kwargs_hash}'
+        with self.active_lock:
+            if dirpath in self.active_dirpaths:
+                dirpath = dirpath.with_name(f'{dirpath.name}_{uuid4().hex[:8]}')
+            self.active_dirpaths.add(dirpath)
+        self.dirpath = dirpath
+        self.chat_name: str | None = None
+        self.chunk_count = 0
+        # последний полученный id сообщения, в том числе без текста, и кол-во полученных сообщений для limit
+        self.last_offset_id = 0
+        self.fetched_count = 0
+        self.row_count = 0
+        self.is_complete = False
+        self.created_at = datetime.now(timezone.utc)
+        # True, если парсинг продолжен с частей, сохраненных предыдущим запуском
+        self.is_resumed = False
+        self.load()
+
+    @property
+    def progress_path(self) -> Path:
+        return self.dirpath / self.progress_filename
+
+    def get_chunk_path(self, chunk_index: int) -> Path:
+        return self.dirpath / f'chunk_{chunk_index:06d}.jsonl.gz'
+
+    @staticmethod
+    def write_atomic(path: Path, data: bytes) -> None:
+        tmp_path = path.with_name(f'{path.name}.tmp')
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def encode_messages(message_dicts: Collection[MESSAGE_DICT]) -> bytes:
+        lines = []
+        for message_dict in message_dicts:
+            row = dict(message_dict)
+            for field in DATE_FIELDS:
+                if isinstance(row.get(field), datetime):
+                    row[field] = row[field].isoformat()
+            lines.append(json.dumps(row, ensure_ascii=False) + '\n')
+        return gzip.compress(''.join(lines).encode('utf-8'))
+
+    @staticmethod
+    def decode_message(line: str) -> MESSAGE_DICT:
+        message_dict = json.loads(line)
+        for field in DATE_FIELDS:
+            if message_dict.get(field) is not None:
+                message_dict[field] = datetime.fromisoformat(message_dict[field])
+        return message_dict
+
+    @classmethod
+    def is_expired(cls, created_at: datetime) -> bool:
+        return (datetime.now(timezone.utc) - created_at).total_seconds() > cls.max_age_sec
+
+    def load(self) -> None:
+        if not self.progress_path.is_file():
+            return
+        with open(self.progress_path, encoding='utf-8') as file:
+            progress = json.load(file)
+        # части старше max_age_sec и части старого формата без created_at удаляются, парсинг начинается заново
+        created_at = progress.get('created_at')
+        if created_at is None or self.is_expired(datetime.fromisoformat(created_at)):
+            shutil.rmtree(self.dirpath, ignore_errors=True)
+            return
+        self.created_at = datetime.fromisoformat(created_at)
+        self.is_resumed = progress['chunk_count'] > 0 or progress['last_offset_id'] > 0
+        self.chat_name = progress['chat_name']
+        self.chunk_count = progress['chunk_count']
+        self.last_offset_id = progress['last_offset_id']
+        self.fetched_count = progress['fetched_count']
+        self.row_count = progress['row_count']
+        self.is_complete = progress['is_complete']
+
+    def save_progress(self) -> None:
+        progress = {
+            'chat_id': self.chat_id,
+            'chat_name': self.chat_name,
+            'created_at': self.created_at.isoformat(),
+            'parse_kwargs': self.parse_kwargs,
+            'chunk_count': self.chunk_count,
+            'last_offset_id': self.last_offset_id,
+            'fetched_count': self.fetched_count,
+            'row_count': self.row_count,
+            'is_complete': self.is_complete,
+        }
+        self.write_atomic(self.progress_path, json.dumps(progress, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    def commit(
+        self,
+        message_dicts: Collection[MESSAGE_DICT],
+        last_offset_id: int,
+        fetched_count: int,
+        is_complete: bool = False,
+        ) -> None:
+        '''Запись части сообщений и затем отметки прогресса, часть без отметки при продолжении перезаписывается'''
+        self.dirpath.mkdir(parents=True, exist_ok=True)
+        if len(message_dicts) > 0:
+            self.write_atomic(self.get_chunk_path(self.chunk_count), self.encode_messages(message_dicts))
+            self.chunk_count += 1
+            self.row_count += len(message_dicts)
+            if self.chat_name is None:
+                self.chat_name = next(iter(message_dicts)).get('chat_name', '')
+        self.last_offset_id = last_offset_id
+        self.fetched_count = fetched_count
+        self.is_complete = is_complete
+        self.save_progress()
+
+    def get_resume_kwargs(self, parse_kwargs: dict[str, Any]) -> dict[str, Any]:
+        if self.last_offset_id == 0:
+            return dict(parse_kwargs)
+        # offset_id точнее offset_date и при reverse=False, и при reverse=True задает границу с нужной стороны
+        resume_kwargs = dict(parse_kwargs, offset_date=None, offset_id=self.last_offset_id)
+        if parse_kwargs.get('limit') is not None:
+            resume_kwargs['limit'] = max(0, int(parse_kwargs['limit']) - self.fetched_count)
+        return resume_kwargs
+
+    def iter_messages(self) -> Iterator[MESSAGE_DICT]:
+        '''Сообщения из всех частей в хронологическом порядке без дубликатов'''
+        chunk_indexes = range(self.chunk_count)
+        is_reverse = bool(self.parse_kwargs.get('reverse'))
+        if not is_reverse:
+            chunk_indexes = reversed(chunk_indexes)
+        seen_message_ids = set()
+        for chunk_index in chunk_indexes:
+            with gzip.open(self.get_chunk_path(chunk_index), 'rt', encoding='utf-8') as file:
+                message_dicts = [self.decode_message(line) for line in file]
+            if not is_reverse:
+                message_dicts.reverse()
+            for message_dict in message_dicts:
+                if message_dict['message_id'] in seen_message_ids:
+                    continue
+                seen_message_ids.add(message_dict['message_id'])
+                yield message_dict
+
+    @classmethod
+    def get_checkpoints_dir(cls) -> Path:
+        return ResultsDir.path / cls.checkpoints_dirname
+
+    @classmethod
+    def remove_expired(cls) -> None:
+        '''Удаление устаревших частей всех чатов, в том числе чатов, которые больше не парсятся'''
+        checkpoints_dir = cls.get_checkpoints_dir()
+        if not checkpoints_dir.is_dir():
+            return
+        with cls.active_lock:
+            for dirpath in checkpoints_dir.iterdir():
+                if dirpath in cls.active_dirpaths or not dirpath.is_dir():
+                    continue
+                try:
+                    with open(dirpath / cls.progress_filename, encoding='utf-8') as file:
+                        created_at = json.load(file).get('created_at')
+                    is_expired = created_at is None or cls.is_expired(datetime.fromisoformat(created_at))
+                except (OSError, ValueError):
+                    # без отметки прогресса возраст определяется по времени изменения каталога
+                    modified_at = datetime.fromtimestamp(dirpath.stat().st_mtime, tz=timezone.utc)
+                    is_expired = cls.is_expired(modified_at)
+                if is_expired:
+                    shutil.rmtree(dirpath, ignore_errors=True)
+
+    def release(self) -> None:
+        with self.active_lock:
+            self.active_dirpaths.discard(self.dirpath)
+
+    def remove(self) -> None:
+        shutil.rmtree(self.dirpath, ignore_errors=True)
+        self.release()
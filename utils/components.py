@@ -1,3 +1,5 @@
+import asyncio
+import logging
 import os
 from pathlib import Path
 from typing import Callable, Collection
@@ -5,8 +7,14 @@ from typing import Callable, Collection
 import gradio as gr
 from telethon.sessions import SQLiteSession, MemorySession
 
-from utils.auth import AuthState
+from utils.auth import AuthState, ClientConnector
+from utils.chats import ChatRegistry
+from utils.dialogs import DialogImporter, DialogInfo
+from utils.live import LiveCapture
 from utils.parser import Parser
+from utils.profiling import JobProfiler
+from utils.search import SearchIndex
+from utils.sinks import SINKS, DEFAULT_EXPORT_FORMATS, SearchIndexSink
 from utils.validation import Validator
 
 
@@ -174,6 +182,111 @@ class Components:
             )
         return component
 
+    @staticmethod
+    def dialog_types() -> gr.CheckboxGroup:
+        component = gr.CheckboxGroup(
+            choices=[(label, dialog_type) for dialog_type, label in DialogImporter.dialog_types.items()],
+            value=list(DialogImporter.dialog_types),
+            label='Типы диалогов',
+            )
+        return component
+
+    @staticmethod
+    def dialogs_archived() -> gr.Radio:
+        component = gr.Radio(
+            choices=['Все', 'Только архив', 'Без архива'],
+            value='Все',
+            label='Архив',
+            )
+        return component
+
+    @staticmethod
+    def load_dialogs_btn() -> gr.Button:
+        component = gr.Button(
+            value='Загрузить диалоги',
+            scale=0,
+            )
+        return component
+
+    @staticmethod
+    def dialogs(choices: list[tuple[str, int]] | None = None) -> gr.CheckboxGroup:
+        component = gr.CheckboxGroup(
+            choices=choices or [],
+            value=[],
+            label='Диалоги аккаунта',
+            )
+        return component
+
+    @staticmethod
+    def dialogs_estimate() -> gr.Textbox:
+        component = gr.Textbox(
+            label='Оценка объема парсинга',
+            placeholder='Здесь будет оценка кол-ва сообщений и времени парсинга',
+            interactive=False,
+            lines=3,
+            )
+        return component
+
+    @staticmethod
+    def add_dialogs_btn() -> gr.Button:
+        component = gr.Button(
+            value='Добавить выбранные диалоги',
+            scale=0,
+            )
+        return component
+
+    @staticmethod
+    def chat_set_name() -> gr.Textbox:
+        component = gr.Textbox(
+            label='Имя набора чатов',
+            placeholder='Имя для сохранения текущего списка чатов',
+            scale=1,
+            )
+        return component
+
+    @staticmethod
+    def chat_sets(value: str | None = None, chat_sets: list[str] | None = None) -> gr.Dropdown:
+        chat_sets = chat_sets or []
+        component = gr.Dropdown(
+            choices=chat_sets,
+            value=value if value in chat_sets else None,
+            label='Сохраненные наборы чатов',
+            scale=1,
+            )
+        return component
+
+    @staticmethod
+    def save_chat_set_btn() -> gr.Button:
+        component = gr.Button(
+            value='Сохранить набор',
+            scale=0,
+            )
+        return component
+
+    @staticmethod
+    def load_chat_set_btn() -> gr.Button:
+        component = gr.Button(
+            value='Загрузить набор',
+            scale=0,
+            )
+        return component
+
+    @staticmethod
+    def delete_chat_set_btn() -> gr.Button:
+        component = gr.Button(
+            value='Удалить набор',
+            scale=0,
+            )
+        return component
+
+    @staticmethod
+    def clear_chats_list_btn() -> gr.Button:
+        component = gr.Button(
+            value='Очистить список',
+            scale=0,
+            )
+        return component
+
     @staticmethod
     def chats_list_status() -> gr.Textbox:
         component = gr.Textbox(
@@ -205,13 +318,143 @@ class Components:
     @staticmethod
     def download_btn(value: str | None = None) -> gr.Button:
         component = gr.DownloadButton(
-            label='Загрузить csv результаты',
+            label='Загрузить результаты',
             value=value,
             visible=value is not None,
             scale=0,
             )
         return component
 
+    @staticmethod
+    def export_formats() -> gr.CheckboxGroup:
+        component = gr.CheckboxGroup(
+            choices=list(SINKS),
+            value=DEFAULT_EXPORT_FORMATS,
+            label='Форматы экспорта',
+            info=(
+                'Все форматы записываются за один проход по сообщениям, stdout - вывод JSON Lines в консоль, '
+                'search_index - добавление сообщений в индекс для поиска, '
+                'star_schema - одна таблица сообщений и таблицы чатов и отправителей на все чаты, '
+                'stats - статистика чата по дням, отправителям, длине текста и часам активности'
+            ),
+            )
+        return component
+
+    @staticmethod
+    def start_live_btn() -> gr.Button:
+        component = gr.Button(
+            value='Запустить live-режим',
+            scale=0,
+            )
+        return component
+
+    @staticmethod
+    def stop_live_btn() -> gr.Button:
+        component = gr.Button(
+            value='Остановить live-режим',
+            scale=0,
+            )
+        return component
+
+    @staticmethod
+    def live_status() -> gr.Textbox:
+        component = gr.Textbox(
+            label='Статус live-режима',
+            placeholder='Новые сообщения добавленных чатов будут записываться в выбранные форматы экспорта',
+            interactive=False,
+            lines=3,
+            )
+        return component
+
+    @staticmethod
+    def live_status_timer(active: bool = False) -> gr.Timer:
+        # включается только пока live-режим запущен, чтобы страницы без live-режима не опрашивали сервер
+        component = gr.Timer(
+            value=LiveCapture.flush_interval,
+            active=active,
+            )
+        return component
+
+    @staticmethod
+    def search_query() -> gr.Textbox:
+        component = gr.Textbox(
+            label='Поисковый запрос',
+            placeholder='Слова для поиска, все слова должны встречаться в сообщении, префикс* - поиск по началу слова',
+            scale=2,
+            )
+        return component
+
+    @staticmethod
+    def search_raw_query() -> gr.Checkbox:
+        component = gr.Checkbox(
+            value=False,
+            label='Синтаксис FTS5',
+            info='Запрос передается в SQLite FTS5 как есть: "точная фраза", OR, NOT, NEAR',
+            scale=0,
+            )
+        return component
+
+    @staticmethod
+    def get_search_args() -> list[gr.component]:
+        chat_id = gr.Number(
+            value=None,
+            label='Chat ID',
+            info='Искать только в этом чате',
+            precision=0,
+            )
+        sender = gr.Textbox(
+            value=None,
+            label='Отправитель',
+            info='ID или username отправителя',
+            )
+        date_from = gr.DateTime(
+            value=None,
+            label='date_from',
+            info='С какой даты искать',
+            timezone='Europe/Moscow',
+            )
+        date_to = gr.DateTime(
+            value=None,
+            label='date_to',
+            info='До какой даты искать',
+            timezone='Europe/Moscow',
+            )
+        limit = gr.Number(
+            value=20,
+            label='limit',
+            info='Сколько результатов показывать',
+            precision=0,
+            )
+        search_args = [chat_id, sender, date_from, date_to, limit]
+        return search_args
+
+    @staticmethod
+    def search_btn() -> gr.Button:
+        component = gr.Button(
+            value='Найти',
+            scale=0,
+            )
+        return component
+
+    @staticmethod
+    def search_results() -> gr.Dataframe:
+        component = gr.Dataframe(
+            headers=['chat_name', 'chat_id', 'message_id', 'date', 'sender', 'snippet'],
+            label='Результаты поиска',
+            interactive=False,
+            wrap=True,
+            )
+        return component
+
+    @staticmethod
+    def profile() -> gr.Checkbox:
+        component = gr.Checkbox(
+            value=JobProfiler.is_enabled(),
+            label='Профилирование',
+            info=f'Профиль CPU и памяти по стадиям парсинга, по умолчанию задается переменной {JobProfiler.env_var}',
+            )
+        return component
+
     @staticmethod
     def get_parse_args() -> list[gr.component]:
         limit = gr.Number(
@@ -250,6 +493,13 @@ class ComponentsFn(Components):
         delete_session_btn = cls.delete_session_btn(visible=auth_state.is_auth, render=render)
         return code, code_btn, password_2fa, password_2fa_btn, delete_session_btn
 
+    @staticmethod
+    async def apply_start_auth_status(auth_state: AuthState) -> None:
+        if AuthState.start_auth_check is None:
+            return
+        start_auth_state = await asyncio.wrap_future(AuthState.start_auth_check)
+        auth_state.apply_start_auth_status(start_auth_state)
+
     @staticmethod
     def update_auth_state_session_type(auth_state: AuthState, session_type: str) -> None:
         auth_state.change_session_type(session_type)
@@ -259,12 +509,220 @@ class ComponentsFn(Components):
         await auth_state.delete_session()
 
     @classmethod
-    def update_download_btn(cls, csv_paths: Collection[Path]) -> gr.Button | None:
+    async def update_download_btn(cls, csv_paths: Collection[Path]) -> gr.Button | None:
         if len(csv_paths) == 0:
             return None
         elif len(csv_paths) == 1:
             filepath = csv_paths[0]
         else:
-            filepath = Parser.zip_files(csv_paths)
+            loop = asyncio.get_running_loop()
+            filepath = await loop.run_in_executor(Parser.export_executor, Parser.zip_files, csv_paths)
         component = cls.download_btn(value=filepath)
         return component
+
+    @classmethod
+    async def load_dialogs(cls, auth_state: AuthState, api_id: str, api_hash: str, *dialogs_args) -> tuple:
+        dialogs_info, dialogs = await DialogImporter.load_dialogs(auth_state, api_id, api_hash, *dialogs_args)
+        choices = [(dialog.get_label(), chat_id) for chat_id, dialog in dialogs.items()]
+        return dialogs, cls.dialogs(choices=choices), dialogs_info
+
+    @staticmethod
+    def update_dialogs_estimate(dialogs: dict[int, DialogInfo], selected_ids: list[int], limit: float | None) -> str:
+        selected_dialogs = [dialogs[chat_id] for chat_id in selected_ids if chat_id in dialogs]
+        return DialogImporter.get_estimate_info(selected_dialogs, limit)
+
+    @staticmethod
+    def add_dialogs_to_chats_list(dialogs: dict[int, DialogInfo], selected_ids: list[int], chats_list: ChatRegistry) -> str:
+        for chat_id in selected_ids:
+            if chat_id in dialogs:
+                chats_list.add(dialogs[chat_id].chat)
+        return Parser.get_chats_info(chats_list)
+
+    @staticmethod
+    async def get_owner_id(auth_state: AuthState, api_id: str, api_hash: str) -> int | None:
+        '''id аккаунта, к которому привязаны наборы чатов и поисковый индекс, или None если клиент не авторизован'''
+        try:
+            return await ClientConnector.get_user_id(auth_state, api_id, api_hash)
+        except Exception as ex:
+            gr.Info(f'Доступно после авторизации, код ошибки: {ex}')
+            return None
+
+    @classmethod
+    async def update_chat_sets(cls, auth_state: AuthState, api_id: str, api_hash: str) -> gr.Dropdown:
+        owner_id = await cls.get_owner_id(auth_state, api_id, api_hash)
+        if owner_id is None:
+            return cls.chat_sets()
+        return cls.chat_sets(chat_sets=ChatRegistry.list_chat_sets(owner_id))
+
+    @classmethod
+    async def save_chat_set(
+        cls,
+        auth_state: AuthState,
+        api_id: str,
+        api_hash: str,
+        chats_list: ChatRegistry,
+        chat_set_name: str,
+        ) -> tuple[gr.Dropdown, str]:
+        owner_id = await cls.get_owner_id(auth_state, api_id, api_hash)
+        if owner_id is None:
+            return cls.chat_sets(), Parser.get_chats_info(chats_list)
+        if len(chats_list) == 0:
+            gr.Info('Список чатов пустой')
+        else:
+            try:
+                chats_list.save(chat_set_name, owner_id)
+                gr.Info(f'Набор чатов {chat_set_name} сохранен')
+            except Exception as ex:
+                gr.Info(f'Ошибка при сохранении набора чатов, код ошибки: {ex}')
+        chat_sets = ChatRegistry.list_chat_sets(owner_id)
+        return cls.chat_sets(value=chat_set_name.strip(), chat_sets=chat_sets), Parser.get_chats_info(chats_list)
+
+    @classmethod
+    async def load_chat_set(
+        cls,
+        auth_state: AuthState,
+        api_id: str,
+        api_hash: str,
+        chats_list: ChatRegistry,
+        chat_set_name: str | None,
+        ) -> tuple[ChatRegistry, str]:
+        if not chat_set_name:
+            gr.Info('Не выбран набор чатов')
+            return chats_list, Parser.get_chats_info(chats_list)
+        owner_id = await cls.get_owner_id(auth_state, api_id, api_hash)
+        if owner_id is None:
+            return chats_list, Parser.get_chats_info(chats_list)
+        try:
+            chats_list = ChatRegistry.load(chat_set_name, owner_id)
+        except Exception as ex:
+            gr.Info(f'Ошибка при загрузке набора чатов, код ошибки: {ex}')
+        return chats_list, Parser.get_chats_info(chats_list)
+
+    @classmethod
+    async def delete_chat_set(
+        cls,
+        auth_state: AuthState,
+        api_id: str,
+        api_hash: str,
+        chat_set_name: str | None,
+        ) -> gr.Dropdown:
+        owner_id = await cls.get_owner_id(auth_state, api_id, api_hash)
+        if owner_id is None:
+            return cls.chat_sets()
+        if chat_set_name:
+            ChatRegistry.delete_chat_set(chat_set_name, owner_id)
+        return cls.chat_sets(chat_sets=ChatRegistry.list_chat_sets(owner_id))
+
+    @staticmethod
+    def clear_chats_list(chats_list: ChatRegistry) -> str:
+        chats_list.clear()
+        return Parser.get_chats_info(chats_list)
+
+    @classmethod
+    async def search_messages(
+        cls,
+        auth_state: AuthState,
+        api_id: str,
+        api_hash: str,
+        query: str,
+        raw_query: bool,
+        chat_id: float | None,
+        sender: str | None,
+        date_from: float | None,
+        date_to: float | None,
+        limit: float | None,
+        ) -> list[list]:
+
+        if not query or not query.strip():
+            gr.Info('Не задан поисковый запрос')
+            return []
+        owner_id = await cls.get_owner_id(auth_state, api_id, api_hash)
+        if owner_id is None:
+            return []
+        search_index_path = SearchIndexSink.get_filepath(owner_id)
+        if not search_index_path.is_file():
+            gr.Info('Поисковый индекс пуст, выберите формат search_index при парсинге')
+            return []
+        try:
+            with SearchIndex(search_index_path) as search_index:
+                search_results = search_index.search(
+                    query=query.strip(),
+                    raw_query=raw_query,
+                    chat_id=None if chat_id is None else int(chat_id),
+                    sender=sender.strip() if sender and sender.strip() else None,
+                    date_from=date_from,
+                    date_to=date_to,
+                    limit=int(limit) if limit else 20,
+                )
+        except Exception as ex:
+            gr.Info(f'Ошибка при поиске, код ошибки: {ex}')
+            return []
+        rows = []
+        for result in search_results:
+            sender_info = result.sender_username or result.sender_id
+            rows.append([result.chat_name, result.chat_id, result.message_id, result.date, sender_info, result.snippet])
+        return rows
+
+    @classmethod
+    async def start_live_capture(
+        cls,
+        live_capture: LiveCapture | None,
+        auth_state: AuthState,
+        chats_list: ChatRegistry,
+        api_id: str,
+        api_hash: str,
+        export_formats: Collection[str],
+        request: gr.Request,
+        ) -> tuple[LiveCapture | None, str, gr.Timer]:
+
+        if live_capture is not None and live_capture.is_running:
+            return live_capture, live_capture.get_status(), cls.live_status_timer(active=True)
+        if len(chats_list) == 0:
+            return None, 'Список чатов для live-режима пустой', cls.live_status_timer()
+        if len(export_formats) == 0:
+            return None, 'Не выбраны форматы экспорта', cls.live_status_timer()
+
+        client = ClientConnector.get_client(auth_state.get_session(), api_id, api_hash)
+        validation_result = await Validator.validate_auth(client)
+        if not validation_result.is_valid:
+            return None, 'Клиент не авторизован', cls.live_status_timer()
+
+        try:
+            format_kwargs = await Parser.get_format_kwargs(auth_state, api_id, api_hash, export_formats, client)
+            live_capture = LiveCapture(client, chats_list, export_formats, format_kwargs)
+            await live_capture.start()
+        except Exception as ex:
+            await ClientConnector.disconnect(client)
+            return None, f'Ошибка при запуске live-режима, код ошибки: {ex}', cls.live_status_timer()
+        LiveCapture.session_captures[request.session_hash] = live_capture
+        return live_capture, live_capture.get_status(), cls.live_status_timer(active=True)
+
+    @classmethod
+    async def stop_live_capture(
+        cls,
+        live_capture: LiveCapture | None,
+        request: gr.Request,
+        ) -> tuple[None, str, list[Path], gr.Timer]:
+        LiveCapture.session_captures.pop(request.session_hash, None)
+        if live_capture is None or not live_capture.is_running:
+            return None, 'Live-режим не запущен', [], cls.live_status_timer()
+        export_paths = await live_capture.stop()
+        return None, live_capture.get_status(), export_paths, cls.live_status_timer()
+
+    @staticmethod
+    async def stop_session_live_capture(request: gr.Request) -> None:
+        '''Остановка live-режима закрытой вкладки: отключение клиента и закрытие файлов экспорта'''
+        live_capture = LiveCapture.session_captures.pop(request.session_hash, None)
+        if live_capture is None or not live_capture.is_running:
+            return
+        try:
+            export_paths = await live_capture.stop()
+            logging.info(f'Live-режим остановлен после закрытия вкладки, файлы: {export_paths}')
+        except Exception as ex:
+            logging.error(f'Ошибка при остановке live-режима после закрытия вкладки, код ошибки: {ex}')
+
+    @staticmethod
+    def update_live_status(live_capture: LiveCapture | None) -> str | None:
+        if live_capture is None:
+            return gr.skip()
+        return live_capture.get_status()
@@ -0,0 +1,153 @@
+import asyncio
+import math
+from dataclasses import dataclass
+
+from telethon import TelegramClient, errors
+from telethon.tl.custom import Dialog
+
+from utils.auth import AuthState, ClientConnector
+from utils.chats import Chat
+from utils.parser import Parser
+from utils.validation import Validator
+
+
+@dataclass
+class DialogInfo:
+    chat: Chat
+    dialog_type: str
+    is_archived: bool
+    message_count: int | None = None
+
+    def get_label(self) -> str:
+        message_count = '?' if self.message_count is None else self.message_count
+        return f'{self.chat.chat_name} ({self.dialog_type}, сообщений: {message_count})'
+
+
+class DialogImporter:
+    dialog_types = {
+        'user': 'Личные чаты',
+        'group': 'Группы',
+        'channel': 'Каналы',
+    }
+    # сколько запросов кол-ва сообщений выполнять одновременно
+    count_concurrency = 8
+    # iter_messages загружает по 100 сообщений за запрос
+    messages_per_request = 100
+    # примерная задержка одного запроса к Telegram
+    request_latency = 0.3
+    # iter_messages ждет 1 секунду между запросами, если limit больше 3000
+    request_wait_time = 1.0
+    wait_time_limit = 3000
+    # паузы в Parser.get_messages_from_chat: 2 раза по 1 секунде на каждую 1000 сообщений
+    parser_sleep_per_1000 = 2.0
+
+    @staticmethod
+    def get_dialog_type(dialog: Dialog) -> str:
+        if dialog.is_user:
+            return 'user'
+        elif dialog.is_group:
+            return 'group'
+        return 'channel'
+
+    @classmethod
+    async def get_dialogs(
+        cls,
+        client: TelegramClient,
+        dialog_types: list[str],
+        archived: bool | None,
+        ) -> list[DialogInfo]:
+        '''Диалоги аккаунта, archived=True - только архив (папка 1), False - без архива (папка 0), None - все'''
+        dialogs = []
+        async for dialog in client.iter_dialogs(archived=archived, ignore_migrated=True):
+            dialog_type = cls.get_dialog_type(dialog)
+            if dialog_type not in dialog_types:
+                continue
+            chat_username = getattr(dialog.entity, 'username', None) or str(dialog.id)
+            chat = Chat.from_telethon_chat(dialog.entity, chat_username)
+            dialogs.append(DialogInfo(chat, dialog_type, dialog.archived))
+        return dialogs
+
+    @staticmethod
+    async def get_message_count(client: TelegramClient, dialog: DialogInfo, semaphore: asyncio.Semaphore) -> None:
+        '''При FloodWait дольше Parser.retry_max_delay кол-во сообщений остается неизвестным (None)'''
+        async with semaphore:
+            try:
+                messages = await client.get_messages(dialog.chat.chat, limit=0)
+            except errors.FloodWaitError as ex:
+                if ex.seconds > Parser.retry_max_delay:
+                    return
+                await asyncio.sleep(ex.seconds)
+                messages = await client.get_messages(dialog.chat.chat, limit=0)
+            dialog.message_count = messages.total
+
+    @classmethod
+    async def fill_message_counts(cls, client: TelegramClient, dialogs: list[DialogInfo]) -> None:
+        semaphore = asyncio.Semaphore(cls.count_concurrency)
+        tasks = [cls.get_message_count(client, dialog, semaphore) for dialog in dialogs]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @classmethod
+    def estimate_parse_time(cls, message_count: int) -> float:
+        requests_count = math.ceil(message_count / cls.messages_per_request)
+        request_time = cls.request_latency
+        if message_count > cls.wait_time_limit:
+            request_time += cls.request_wait_time
+        parser_sleep_time = message_count // 1000 * cls.parser_sleep_per_1000
+        return requests_count * request_time + parser_sleep_time
+
+    @classmethod
+    def get_estimate_info(cls, dialogs: list[DialogInfo], limit: float | None = None) -> str:
+        if len(dialogs) == 0:
+            return 'Диалоги не выбраны'
+        total_messages = 0
+        total_seconds = 0.0
+        unknown_count = 0
+        for dialog in dialogs:
+            if dialog.message_count is None:
+                unknown_count += 1
+                continue
+            message_count = dialog.message_count
+            if limit:
+                message_count = min(message_count, int(limit))
+            total_messages += message_count
+            total_seconds += cls.estimate_parse_time(message_count)
+
+        minutes, seconds = divmod(int(total_seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        estimate_info = (
+            f'Диалогов: {len(dialogs)}\n'
+            f'Примерное кол-во сообщений: {total_messages}\n'
+            f'Примерное время парсинга: {hours} ч {minutes} мин {seconds} сек'
+        )
+        if unknown_count:
+            estimate_info += f'\nНе удалось получить кол-во сообщений для {unknown_count} диалогов'
+        return estimate_info
+
+    @classmethod
+    async def load_dialogs(
+        cls,
+        auth_state: AuthState,
+        api_id: str,
+        api_hash: str,
+        dialog_types: list[str],
+        archived: str,
+        ) -> tuple[str, dict[int, DialogInfo]]:
+
+        if len(dialog_types) == 0:
+            return 'Не выбраны типы диалогов', {}
+
+        client = ClientConnector.get_client(auth_state.get_session(), api_id, api_hash)
+        validation_result = await Validator.validate_auth(client)
+        if not validation_result.is_valid:
+            return 'Клиент не авторизован', {}
+
+        archived = {'Все': None, 'Только архив': True, 'Без архива': False}[archived]
+        try:
+            async with client:
+                dialogs = await cls.get_dialogs(client, dialog_types, archived)
+                await cls.fill_message_counts(client, dialogs)
+        except Exception as ex:
+            return f'Ошибка при загрузке диалогов, код ошибки: {ex}', {}
+
+        dialogs_info = 'Оценка для всех загруженных диалогов:\n' + cls.get_estimate_info(dialogs)
+        return dialogs_info, {dialog.chat.chat_id: dialog for dialog in dialogs}
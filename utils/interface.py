@@ -1,13 +1,18 @@
 import gradio as gr
 
 from utils.auth import AuthState, ClientConnector
+from utils.chats import ChatRegistry
 from utils.components import Components, ComponentsFn
 from utils.parser import Parser
+from utils.validation import Validator
 
 
 def create_interface() -> gr.Blocks:
     auth_state = AuthState()
-    auth_state.check_start_auth_status()
+    # проверка сохраненной сессии идет в фоне, результат применяется к сеансу пользователя при загрузке страницы
+    AuthState.start_auth_status_check()
+    if Validator.validate_env_vars().is_valid:
+        auth_state.set_start_auth_check()
 
     # css = '.gradio-container {width: 60% !important}'
     css = '''
@@ -21,7 +26,9 @@ def create_interface() -> gr.Blocks:
         gr.Markdown(Components.welcome_message_markdown)
         
         auth_state = gr.State(auth_state)
-        chats_list = gr.State([])
+        chats_list = gr.State(ChatRegistry())
+        dialogs = gr.State({})
+        live_capture = gr.State(None)
         csv_names = gr.State([])
 
         dynamic_visible_components = ComponentsFn.get_dynamic_visible_components(auth_state.value, render=False)
@@ -112,6 +119,21 @@ def create_interface() -> gr.Blocks:
             outputs=None,
         )
 
+        interface.load(
+            fn=ComponentsFn.apply_start_auth_status,
+            inputs=[auth_state],
+            outputs=None,
+            show_progress='hidden',
+        ).then(
+            fn=ComponentsFn.get_dynamic_visible_components,
+            inputs=[auth_state],
+            outputs=dynamic_visible_components,
+        ).then(
+            fn=ComponentsFn.update_status,
+            inputs=[auth_state],
+            outputs=[auth_status],
+        )
+
 
         with gr.Group():
             gr.Markdown('Парсинг')
@@ -122,16 +144,41 @@ def create_interface() -> gr.Blocks:
                         chats_usernames = Components.chats_usernames()
                         add_chat_btn = Components.add_chat_btn()
                         chats_list_status = Components.chats_list_status()
+                        clear_chats_list_btn = Components.clear_chats_list_btn()
+                    with gr.Accordion('Наборы чатов', open=False) as chat_sets_accordion:
+                        chat_set_name = Components.chat_set_name()
+                        save_chat_set_btn = Components.save_chat_set_btn()
+                        chat_sets = Components.chat_sets()
+                        with gr.Row():
+                            load_chat_set_btn = Components.load_chat_set_btn()
+                            delete_chat_set_btn = Components.delete_chat_set_btn()
+                    with gr.Accordion('Импорт диалогов аккаунта', open=False):
+                        dialogs_args = [
+                            Components.dialog_types(),
+                            Components.dialogs_archived(),
+                        ]
+                        load_dialogs_btn = Components.load_dialogs_btn()
+                        dialogs_checkbox = Components.dialogs()
+                        dialogs_estimate = Components.dialogs_estimate()
+                        add_dialogs_btn = Components.add_dialogs_btn()
                 with gr.Column():
                     with gr.Group():
                         gr.Markdown('Параметры парсинга')
                         parse_args = Components.get_parse_args()
+                        export_formats = Components.export_formats()
+                        profile = Components.profile()
                 with gr.Column():
                     with gr.Group():
                         gr.Markdown('Результаты парсинга')
                         start_parse_btn = Components.start_parse_btn()
                         parse_status = Components.parse_status()
                         download_btn = Components.download_btn()
+                    with gr.Accordion('Live-режим', open=False):
+                        with gr.Row():
+                            start_live_btn = Components.start_live_btn()
+                            stop_live_btn = Components.stop_live_btn()
+                        live_status = Components.live_status()
+                        live_status_timer = Components.live_status_timer()
 
         add_chat_btn.click(
             fn=Parser.add_chat_to_chats_list,
@@ -139,9 +186,58 @@ def create_interface() -> gr.Blocks:
             outputs=[chats_list_status],
         )
 
+        clear_chats_list_btn.click(
+            fn=ComponentsFn.clear_chats_list,
+            inputs=[chats_list],
+            outputs=[chats_list_status],
+        )
+
+        chat_sets_accordion.expand(
+            fn=ComponentsFn.update_chat_sets,
+            inputs=[auth_state, api_id, api_hash],
+            outputs=[chat_sets],
+        )
+
+        save_chat_set_btn.click(
+            fn=ComponentsFn.save_chat_set,
+            inputs=[auth_state, api_id, api_hash, chats_list, chat_set_name],
+            outputs=[chat_sets, chats_list_status],
+        )
+
+        load_chat_set_btn.click(
+            fn=ComponentsFn.load_chat_set,
+            inputs=[auth_state, api_id, api_hash, chats_list, chat_sets],
+            outputs=[chats_list, chats_list_status],
+        )
+
+        delete_chat_set_btn.click(
+            fn=ComponentsFn.delete_chat_set,
+            inputs=[auth_state, api_id, api_hash, chat_sets],
+            outputs=[chat_sets],
+        )
+
+        load_dialogs_btn.click(
+            fn=ComponentsFn.load_dialogs,
+            inputs=[auth_state, api_id, api_hash, *dialogs_args],
+            outputs=[dialogs, dialogs_checkbox, dialogs_estimate],
+        )
+
+        gr.on(
+            triggers=[dialogs_checkbox.input, parse_args[0].change],
+            fn=ComponentsFn.update_dialogs_estimate,
+            inputs=[dialogs, dialogs_checkbox, parse_args[0]],
+            outputs=[dialogs_estimate],
+        )
+
+        add_dialogs_btn.click(
+            fn=ComponentsFn.add_dialogs_to_chats_list,
+            inputs=[dialogs, dialogs_checkbox, chats_list],
+            outputs=[chats_list_status],
+        )
+
         start_parse_btn.click(
             fn=Parser.parse_chats,
-            inputs=[auth_state, chats_list, api_id, api_hash, *parse_args],
+            inputs=[auth_state, chats_list, api_id, api_hash, export_formats, profile, *parse_args],
             outputs=[parse_status, csv_names],
         ).then(
             fn=ComponentsFn.update_download_btn,
@@ -149,4 +245,47 @@ def create_interface() -> gr.Blocks:
             outputs=[download_btn],
         )
 
+        start_live_btn.click(
+            fn=ComponentsFn.start_live_capture,
+            inputs=[live_capture, auth_state, chats_list, api_id, api_hash, export_formats],
+            outputs=[live_capture, live_status, live_status_timer],
+        )
+
+        stop_live_btn.click(
+            fn=ComponentsFn.stop_live_capture,
+            inputs=[live_capture],
+            outputs=[live_capture, live_status, csv_names, live_status_timer],
+        ).then(
+            fn=ComponentsFn.update_download_btn,
+            inputs=[csv_names],
+            outputs=[download_btn],
+        )
+
+        live_status_timer.tick(
+            fn=ComponentsFn.update_live_status,
+            inputs=[live_capture],
+            outputs=[live_status],
+            show_progress='hidden',
+        )
+
+        # после закрытия вкладки live-режим останавливается, иначе клиент и файлы экспорта остаются открытыми
+        interface.unload(fn=ComponentsFn.stop_session_live_capture)
+
+        with gr.Group():
+            gr.Markdown('Поиск по сообщениям')
+            with gr.Row():
+                search_query = Components.search_query()
+                search_raw_query = Components.search_raw_query()
+                search_btn = Components.search_btn()
+            with gr.Row():
+                search_args = Components.get_search_args()
+            search_results = Components.search_results()
+
+        gr.on(
+            triggers=[search_btn.click, search_query.submit],
+            fn=ComponentsFn.search_messages,
+            inputs=[auth_state, api_id, api_hash, search_query, search_raw_query, *search_args],
+            outputs=[search_results],
+        )
+
     return interface
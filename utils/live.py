@@ -0,0 +1,196 @@
+import asyncio
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Collection
+
+from telethon import TelegramClient, events, types
+
+from utils.chats import Chat
+from utils.parser import Parser
+from utils.sinks import MESSAGE_DICT, ResultsDir, SinkGroup
+
+
+class LiveCapture:
+    '''
+    Запись новых и отредактированных сообщений наблюдаемых чатов через обработчики событий Telethon
+    Как и при парсинге, у каждого чата свои файлы экспорта, а форматы задачи (star_schema, search_index) общие
+    '''
+    # размер пачки сообщений, при котором она записывается не дожидаясь таймера
+    batch_size = 100
+    # как часто записывать накопленные сообщения, секунды
+    flush_interval = 5.0
+    # как часто проверять соединение клиента, секунды
+    reconnect_check_interval = 5.0
+    # запущенные захваты по сессиям gradio, чтобы остановить их при закрытии вкладки
+    session_captures: dict[str, 'LiveCapture'] = {}
+
+    def __init__(
+        self,
+        client: TelegramClient,
+        chats: Collection[Chat],
+        export_formats: Collection[str],
+        format_kwargs: dict[str, dict] | None = None,
+        ):
+        self.client = client
+        self.chats = list(chats)
+        self.export_formats = list(export_formats)
+        self.format_kwargs = format_kwargs or {}
+        self.last_message_ids: dict[int, int] = {}
+        # сообщения, ожидающие записи, и признак правки уже записанного сообщения
+        self.pending: list[tuple[MESSAGE_DICT, bool]] = []
+        self.flush_lock = asyncio.Lock()
+        self.tasks: list[asyncio.Task] = []
+        self.job_sink_group: SinkGroup | None = None
+        # приемники чатов создаются при первом сообщении чата
+        self.chat_sink_groups: dict[int, SinkGroup] = {}
+        self.is_running = False
+        self.captured_count = 0
+        self.edited_count = 0
+        self.backfilled_count = 0
+        self.reconnect_count = 0
+        self.started_at: datetime | None = None
+        self.event_builders = [
+            (self.on_new_message, events.NewMessage(chats=[chat.chat for chat in self.chats])),
+            (self.on_message_edited, events.MessageEdited(chats=[chat.chat for chat in self.chats])),
+        ]
+
+    def get_export_stem(self, chat_name: str | None = None) -> Path:
+        stem = f'telegram_live_{self.started_at:%Y%m%d_%H%M%S}'
+        if chat_name is not None:
+            stem += f'_{chat_name}'
+        return ResultsDir.path / stem
+
+    def get_chat_sink_group(self, message_dict: MESSAGE_DICT) -> SinkGroup:
+        chat_id = message_dict['chat_id']
+        if chat_id not in self.chat_sink_groups:
+            stem = self.get_export_stem(message_dict['chat_name'] or str(chat_id))
+            self.chat_sink_groups[chat_id] = SinkGroup.from_formats(self.export_formats, stem, scope='chat')
+        return self.chat_sink_groups[chat_id]
+
+    def close_sinks(self) -> list[Path]:
+        sink_groups = [*self.chat_sink_groups.values()]
+        if self.job_sink_group is not None:
+            sink_groups.append(self.job_sink_group)
+        return SinkGroup([sink for sink_group in sink_groups for sink in sink_group.sinks]).close()
+
+    async def start(self) -> None:
+        self.started_at = datetime.now()
+        self.job_sink_group = SinkGroup.from_formats(
+            self.export_formats, self.get_export_stem(), scope='job', format_kwargs=self.format_kwargs,
+        )
+        try:
+            await self.client.connect()
+            for chat in self.chats:
+                last_messages = await self.client.get_messages(chat.chat, limit=1)
+                self.last_message_ids[chat.chat_id] = last_messages[0].id if last_messages else 0
+            for callback, event_builder in self.event_builders:
+                self.client.add_event_handler(callback, event_builder)
+        except Exception:
+            # открытые файлы приемников закрываются, иначе они остаются открытыми до завершения процесса
+            for callback, event_builder in self.event_builders:
+                self.client.remove_event_handler(callback, event_builder)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(Parser.export_executor, self.close_sinks)
+            raise
+        self.is_running = True
+        self.tasks = [
+            asyncio.create_task(self.flush_loop()),
+            asyncio.create_task(self.reconnect_loop()),
+        ]
+
+    async def stop(self) -> list[Path]:
+        self.is_running = False
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for callback, event_builder in self.event_builders:
+            self.client.remove_event_handler(callback, event_builder)
+        await self.flush()
+        await self.client.disconnect()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(Parser.export_executor, self.close_sinks)
+
+    async def capture(self, message: types.Message, is_edit: bool = False) -> bool:
+        '''
+        Добавление сообщения в очередь записи, False если сообщение без текста и пропущено
+        Отредактированное сообщение записывается отдельной строкой с тем же message_id и заполненным edit_date,
+        приемники со skip_edits (stats) правки не получают
+        '''
+        await message.get_chat()
+        await message.get_sender()
+        message_dict = Parser.message_to_dict(message)
+        if message_dict is None:
+            return False
+        chat_id = message_dict['chat_id']
+        self.last_message_ids[chat_id] = max(self.last_message_ids.get(chat_id, 0), message.id)
+        self.pending.append((message_dict, is_edit))
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+        return True
+
+    async def on_new_message(self, event: events.NewMessage.Event) -> None:
+        if await self.capture(event.message):
+            self.captured_count += 1
+
+    async def on_message_edited(self, event: events.MessageEdited.Event) -> None:
+        if await self.capture(event.message, is_edit=True):
+            self.edited_count += 1
+
+    def write_rows(self, rows: list[tuple[MESSAGE_DICT, bool]]) -> None:
+        for message_dict, is_edit in rows:
+            self.get_chat_sink_group(message_dict).write(message_dict, is_edit)
+            self.job_sink_group.write(message_dict, is_edit)
+        for sink_group in [*self.chat_sink_groups.values(), self.job_sink_group]:
+            sink_group.flush()
+
+    async def flush(self) -> None:
+        async with self.flush_lock:
+            if not self.pending:
+                return
+            rows, self.pending = self.pending, []
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(Parser.export_executor, self.write_rows, rows)
+
+    async def flush_loop(self) -> None:
+        while self.is_running:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as ex:
+                logging.error(f'Ошибка при записи сообщений live-режима, код ошибки: {ex}')
+
+    async def backfill(self) -> None:
+        '''Догрузка сообщений, пропущенных пока клиент был отключен'''
+        for chat in self.chats:
+            min_id = self.last_message_ids.get(chat.chat_id, 0)
+            async for message in self.client.iter_messages(chat.chat, min_id=min_id, reverse=True):
+                message_dict = Parser.message_to_dict(message)
+                if message_dict is not None:
+                    self.pending.append((message_dict, False))
+                    self.backfilled_count += 1
+                self.last_message_ids[chat.chat_id] = max(self.last_message_ids[chat.chat_id], message.id)
+        await self.flush()
+
+    async def reconnect_loop(self) -> None:
+        while self.is_running:
+            await asyncio.sleep(self.reconnect_check_interval)
+            if self.client.is_connected():
+                continue
+            try:
+                await self.client.connect()
+                self.reconnect_count += 1
+                await self.backfill()
+            except Exception as ex:
+                logging.error(f'Ошибка при переподключении live-режима, код ошибки: {ex}')
+
+    def get_status(self) -> str:
+        state = 'запущен' if self.is_running else 'остановлен'
+        chats = ', '.join(str(chat.chat_name) for chat in self.chats)
+        status = (
+            f'Live-режим {state}, чаты: {chats}\n'
+            f'Новых сообщений: {self.captured_count}, отредактированных: {self.edited_count}, '
+            f'догружено после переподключений: {self.backfilled_count}, переподключений: {self.reconnect_count}\n'
+            f'Ожидают записи: {len(self.pending)}'
+        )
+        return status
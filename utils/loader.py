@@ -0,0 +1,269 @@
+'''
+Быстрая загрузка датасетов, сохраненных парсером, с заданной схемой типов
+
+Пример:
+    from utils.loader import load_export, iter_export
+    df = load_export('parse_results_dir/telegram_history_chat.csv', columns=['date', 'text'], date_from='2024-01-01')
+    for chunk in iter_export(paths, chunksize=500_000, chat_ids=[123456]):
+        ...
+'''
+import importlib.util
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Collection, Iterator
+
+import pandas as pd
+
+from utils.sinks import MESSAGE_FIELDS, SqliteSink
+
+
+# схема экспорта Parser.message_to_dict, колонки date и edit_date - время UTC
+EXPORT_DTYPES = {
+    'chat_type': 'category',
+    'chat_name': 'category',
+    'chat_id': 'int64',
+    'message_id': 'Int64',
+    'sender_type': 'category',
+    'sender_username': 'string',
+    'sender_first_name': 'string',
+    'sender_last_name': 'string',
+    'sender_id': 'Int64',
+    'text': 'string',
+}
+DATE_COLUMNS = ['date', 'edit_date']
+DATE_DTYPE = 'datetime64[ns, UTC]'
+DEFAULT_CHUNKSIZE = 100_000
+
+PathsType = str | Path | Collection[str | Path]
+
+
+def _to_paths(paths: PathsType) -> list[Path]:
+    if isinstance(paths, (str, Path)):
+        return [Path(paths)]
+    return [Path(path) for path in paths]
+
+
+def _to_timestamp(date: datetime | str | None) -> pd.Timestamp | None:
+    if date is None:
+        return None
+    timestamp = pd.Timestamp(date)
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize('UTC')
+    return timestamp.tz_convert('UTC')
+
+
+def _get_format(path: Path) -> str:
+    name = path.name.lower()
+    for export_format in ('jsonl.gz', 'csv', 'sqlite', 'arrow'):
+        if name.endswith(f'.{export_format}'):
+            return export_format
+    raise ValueError(f'Неизвестный формат файла экспорта: {path}')
+
+
+def _has_pyarrow() -> bool:
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    for column in df.columns:
+        if column in DATE_COLUMNS:
+            if not isinstance(df[column].dtype, pd.DatetimeTZDtype):
+                df[column] = pd.to_datetime(df[column], format='ISO8601', utc=True)
+            # разные движки чтения дают разное разрешение дат (s, us, ns), приводится к одному
+            if df[column].dtype != DATE_DTYPE:
+                df[column] = df[column].dt.tz_convert('UTC').astype(DATE_DTYPE)
+        elif column in EXPORT_DTYPES and df[column].dtype != EXPORT_DTYPES[column]:
+            df[column] = df[column].astype(EXPORT_DTYPES[column])
+    return df
+
+
+class _Query:
+    '''Проекция колонок и фильтры по чатам и датам, общие для всех форматов'''
+
+    def __init__(
+        self,
+        columns: Collection[str] | None,
+        chat_ids: Collection[int] | None,
+        date_from: datetime | str | None,
+        date_to: datetime | str | None,
+        ):
+        self.columns = list(columns) if columns is not None else None
+        self.chat_ids = list(chat_ids) if chat_ids is not None else None
+        self.date_from = _to_timestamp(date_from)
+        self.date_to = _to_timestamp(date_to)
+
+    @property
+    def filter_columns(self) -> list[str]:
+        filter_columns = []
+        if self.chat_ids is not None:
+            filter_columns.append('chat_id')
+        if self.date_from is not None or self.date_to is not None:
+            filter_columns.append('date')
+        return filter_columns
+
+    def get_read_columns(self, available_columns: Collection[str]) -> list[str]:
+        requested_columns = self.columns if self.columns is not None else list(available_columns)
+        read_columns = list(dict.fromkeys([*requested_columns, *self.filter_columns]))
+        missing_columns = [column for column in read_columns if column not in available_columns]
+        if missing_columns:
+            raise KeyError(f'В файле экспорта нет колонок: {missing_columns}')
+        return read_columns
+
+    def filter(self, df: pd.DataFrame) -> pd.DataFrame:
+        mask = None
+        if self.chat_ids is not None:
+            mask = df['chat_id'].isin(self.chat_ids)
+        if self.date_from is not None:
+            date_mask = df['date'] >= self.date_from
+            mask = date_mask if mask is None else mask & date_mask
+        if self.date_to is not None:
+            date_mask = df['date'] <= self.date_to
+            mask = date_mask if mask is None else mask & date_mask
+        if mask is not None:
+            df = df.loc[mask]
+        if self.columns is not None:
+            df = df[self.columns]
+        return df.reset_index(drop=True)
+
+
+def _read_csv_pyarrow(path: Path, read_columns: list[str]) -> pd.DataFrame:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    # в тексте сообщений бывают переводы строк, по умолчанию pyarrow их внутри значений не допускает
+    parse_options = pa_csv.ParseOptions(newlines_in_values=True)
+    column_types = {
+        column: pa.int64() if EXPORT_DTYPES[column] in ('int64', 'Int64') else pa.string()
+        for column in read_columns if column in EXPORT_DTYPES
+    }
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=read_columns,
+        column_types=column_types,
+        strings_can_be_null=True,
+    )
+    table = pa_csv.read_csv(path, parse_options=parse_options, convert_options=convert_options)
+    # без types_mapper целые колонки с пропусками стали бы float64 с потерей точности больших id
+    return table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+
+
+def _iter_csv(path: Path, query: _Query, chunksize: int | None) -> Iterator[pd.DataFrame]:
+    available_columns = pd.read_csv(path, nrows=0).columns
+    read_columns = query.get_read_columns(available_columns)
+    dtypes = {column: EXPORT_DTYPES[column] for column in read_columns if column in EXPORT_DTYPES}
+    if chunksize is None and _has_pyarrow():
+        chunks = [_read_csv_pyarrow(path, read_columns)]
+    elif chunksize is None:
+        chunks = [pd.read_csv(path, usecols=read_columns, dtype=dtypes)]
+    else:
+        chunks = pd.read_csv(path, usecols=read_columns, dtype=dtypes, chunksize=chunksize)
+    for chunk in chunks:
+        yield query.filter(apply_schema(chunk))
+
+
+def _iter_jsonl(path: Path, query: _Query, chunksize: int | None) -> Iterator[pd.DataFrame]:
+    reader = pd.read_json(path, lines=True, dtype=False, compression='gzip', chunksize=chunksize or DEFAULT_CHUNKSIZE)
+    with reader:
+        for chunk in reader:
+            chunk = chunk[query.get_read_columns(chunk.columns)]
+            yield query.filter(apply_schema(chunk))
+
+
+def _iter_sqlite(path: Path, query: _Query, chunksize: int | None) -> Iterator[pd.DataFrame]:
+    # фильтры выполняются в SQLite, даты хранятся строками ISO 8601 в UTC
+    with sqlite3.connect(f'file:{path}?mode=ro', uri=True) as connection:
+        # в экспортах старых версий может не быть новых колонок, например edit_date
+        available_columns = [row[1] for row in connection.execute(f'PRAGMA table_info({SqliteSink.table_name})')]
+    read_columns = query.get_read_columns(available_columns)
+    conditions = []
+    params = []
+    if query.chat_ids is not None:
+        conditions.append(f'chat_id IN ({", ".join("?" * len(query.chat_ids))})')
+        params.extend(query.chat_ids)
+    if query.date_from is not None:
+        conditions.append('date >= ?')
+        params.append(query.date_from.isoformat())
+    if query.date_to is not None:
+        conditions.append('date <= ?')
+        params.append(query.date_to.isoformat())
+    sql_query = f'SELECT {", ".join(read_columns)} FROM {SqliteSink.table_name}'
+    if conditions:
+        sql_query += ' WHERE ' + ' AND '.join(conditions)
+
+    with sqlite3.connect(f'file:{path}?mode=ro', uri=True) as connection:
+        chunks = pd.read_sql_query(sql_query, connection, params=params, chunksize=chunksize)
+        if chunksize is None:
+            chunks = [chunks]
+        for chunk in chunks:
+            yield query.filter(apply_schema(chunk))
+
+
+def _iter_arrow(path: Path, query: _Query, chunksize: int | None) -> Iterator[pd.DataFrame]:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    with pa.memory_map(str(path), 'r') as source:
+        reader = pa.ipc.open_file(source)
+        read_columns = query.get_read_columns(reader.schema.names)
+        if chunksize is None:
+            tables = [reader.read_all()]
+        else:
+            tables = (pa.Table.from_batches([reader.get_batch(i)]) for i in range(reader.num_record_batches))
+        for table in tables:
+            # фильтры применяются до конвертации в pandas, чтобы не копировать лишние строки из memory map
+            table = table.select(read_columns)
+            if query.chat_ids is not None:
+                table = table.filter(pc.is_in(table['chat_id'], value_set=pa.array(query.chat_ids, pa.int64())))
+            if query.date_from is not None:
+                table = table.filter(pc.greater_equal(table['date'], pa.scalar(query.date_from, table.schema.field('date').type)))
+            if query.date_to is not None:
+                table = table.filter(pc.less_equal(table['date'], pa.scalar(query.date_to, table.schema.field('date').type)))
+            if chunksize is None:
+                slices = [table]
+            else:
+                slices = (table.slice(offset, chunksize) for offset in range(0, table.num_rows, chunksize))
+            for table_slice in slices:
+                yield query.filter(apply_schema(table_slice.to_pandas()))
+
+
+_READERS = {
+    'csv': _iter_csv,
+    'jsonl.gz': _iter_jsonl,
+    'sqlite': _iter_sqlite,
+    'arrow': _iter_arrow,
+}
+
+
+def iter_export(
+    paths: PathsType,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    columns: Collection[str] | None = None,
+    chat_ids: Collection[int] | None = None,
+    date_from: datetime | str | None = None,
+    date_to: datetime | str | None = None,
+    ) -> Iterator[pd.DataFrame]:
+    '''Чтение одного или нескольких файлов экспорта частями по chunksize строк'''
+    query = _Query(columns, chat_ids, date_from, date_to)
+    for path in _to_paths(paths):
+        for chunk in _READERS[_get_format(path)](path, query, chunksize):
+            if len(chunk) > 0:
+                yield chunk
+
+
+def load_export(
+    paths: PathsType,
+    columns: Collection[str] | None = None,
+    chat_ids: Collection[int] | None = None,
+    date_from: datetime | str | None = None,
+    date_to: datetime | str | None = None,
+    ) -> pd.DataFrame:
+    '''Загрузка одного или нескольких файлов экспорта в один DataFrame'''
+    query = _Query(columns, chat_ids, date_from, date_to)
+    frames = []
+    for path in _to_paths(paths):
+        frames.extend(_READERS[_get_format(path)](path, query, None))
+    if len(frames) == 0:
+        return apply_schema(pd.DataFrame(columns=query.columns or MESSAGE_FIELDS))
+    df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    # при объединении категории разных файлов превращаются в object
+    return apply_schema(df)
@@ -1,19 +1,23 @@
 import asyncio
+import logging
 import zipfile
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Collection
+from typing import Collection, Iterable
 
-import pandas as pd
 import gradio as gr
 from telethon import TelegramClient, types, errors
 
 from utils.auth import AuthState, ClientConnector
+from utils.checkpoint import ChatCheckpoint
+from utils.chats import Chat, ChatRegistry
+from utils.profiling import JobProfiler
+from utils.sinks import MESSAGE_DICT, CsvSink, ResultsDir, SearchIndexSink, SinkGroup, StatsSink
+from utils.stats import ChatStats
 from utils.validation import Validator
 
 
-MESSAGE_DICT = dict[str, str | int | datetime | None]
 DEFAULT_PARSE_KWARGS = dict(
     limit=None,
     offset_date=None,
@@ -21,32 +25,18 @@ DEFAULT_PARSE_KWARGS = dict(
 )
 
 
-@dataclass
-class Chat:
-    chat: types.TLObject
-    chat_name: str | None
-    chat_username: str
-    chat_type: str
-    chat_id: int
-
-    @classmethod
-    def from_telethon_chat(cls, chat: types.TLObject, chat_username: str):
-        chat_id = chat.id
-        if isinstance(chat, types.User):
-            chat_type = 'Chat'
-            chat_name = f'{chat.first_name} {chat.last_name}'
-        else:
-            chat_type = 'Channel/Group'
-            chat_name = chat.title
-        return cls(chat, chat_name, chat_username, chat_type, chat_id)
-
-    def get_chat_info(self) -> str:
-        chat_info = f'Chat name: {self.chat_name}, Chat type: {self.chat_type}, Chat ID: {self.chat_id}'
-        return chat_info
-
-
 class Parser:
-    parse_results_dir = Path('parse_results_dir')
+    # сохранение и архивация выполняются в потоках, чтобы не блокировать event loop
+    export_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='export')
+    # сколько спарсенных чатов может ожидать записи, пока парсится следующий
+    export_queue_size = 2
+    # сообщения конвертируются пачками, чтобы стадия convert профайлера замерялась на пачку, а не на каждое сообщение
+    convert_batch_size = 100
+    # повторные попытки парсинга чата после временных ошибок, каждая продолжает с последней сохраненной части
+    max_retries = 5
+    retry_base_delay = 2.0
+    retry_max_delay = 300.0
+    retry_exceptions = (errors.FloodWaitError, errors.ServerError, errors.TimedOutError, ConnectionError, TimeoutError)
 
     @staticmethod
     def message_to_dict(message: types.Message) -> MESSAGE_DICT:
@@ -60,7 +50,7 @@ class Parser:
         chat = message._chat
         chat_id = chat.id
         chat_type = type(chat).__name__
-        chat_name = chat.title if isinstance(chat, types.Channel) else f'{chat.first_name} {chat.last_name}'
+        chat_name = f'{chat.first_name} {chat.last_name}' if isinstance(chat, types.User) else chat.title
 
         if isinstance(sender, types.User):
             sender_id = message.sender.id
@@ -78,36 +68,62 @@ class Parser:
             'chat_type': chat_type,
             'chat_name': chat_name,
             'chat_id': chat_id,
+            'message_id': message.id,
             'sender_type': sender_type,
             'sender_username': username,
             'sender_first_name': first_name,
             'sender_last_name': last_name,
             'sender_id': sender_id,
             'text': text,
+            'edit_date': message.edit_date,
         }
         return message_dict
 
+    @classmethod
+    def messages_to_dicts(cls, messages: Iterable[types.Message]) -> list[MESSAGE_DICT]:
+        '''Конвертация пачки сообщений, сообщения без текста пропускаются'''
+        # без цикла на Python: семплер видит время внутри message_to_dict, а не в строке цикла
+        return list(filter(None, map(cls.message_to_dict, messages)))
+
     @classmethod
     async def get_messages_from_chat(
         cls,
         client: TelegramClient,
         chat: types.TLObject,
+        checkpoint: ChatCheckpoint,
         parse_chats_pb_info: str,
+        profiler: JobProfiler | None = None,
         **parse_kwargs,
-        ) -> list[MESSAGE_DICT]:
+        ) -> None:
 
+        if profiler is None:
+            profiler = JobProfiler(enabled=False)
+        loop = asyncio.get_running_loop()
         async with client:
             progress = gr.Progress()
-            messages = client.iter_messages(entity=chat, **parse_kwargs)
+            messages = client.iter_messages(entity=chat, **checkpoint.get_resume_kwargs(parse_kwargs))
             message_dicts = []
-            message_count = 0
+            batch = []
+            message_count = checkpoint.fetched_count
+            last_offset_id = checkpoint.last_offset_id
             async for message in messages:
                 message_count += 1
                 if message_count % 1000 == 0:
                     await asyncio.sleep(1)
-                message_dict = cls.message_to_dict(message)
-                if message_dict is not None:
-                    message_dicts.append(message_dict)
+                batch.append(message)
+                last_offset_id = message.id
+
+                if len(batch) >= cls.convert_batch_size:
+                    with profiler.stage('convert'):
+                        message_dicts.extend(cls.messages_to_dicts(batch))
+                    batch = []
+
+                if len(message_dicts) >= checkpoint.chunk_size:
+                    await loop.run_in_executor(
+                        cls.export_executor, profiler.call, 'checkpoint',
+                        checkpoint.commit, message_dicts, last_offset_id, message_count,
+                    )
+                    message_dicts = []
 
                 if message_count % 1000 == 0:
                     await asyncio.sleep(1)
@@ -118,72 +134,245 @@ class Parser:
                 else:
                     progress(message_count, desc=f'{parse_chats_pb_info}, Parsing messages {message_count}/?')
 
-        if not parse_kwargs['reverse']:
-            message_dicts = message_dicts[::-1]
-        return message_dicts
+            with profiler.stage('convert'):
+                message_dicts.extend(cls.messages_to_dicts(batch))
+
+        await loop.run_in_executor(
+            cls.export_executor, profiler.call, 'checkpoint',
+            checkpoint.commit, message_dicts, last_offset_id, message_count, True,
+        )
+
+    @classmethod
+    def get_retry_delay(cls, ex: Exception, attempt: int) -> float:
+        '''Пауза перед повтором, FloodWait дольше retry_max_delay не ожидается - парсинг продолжится при следующем запуске'''
+        if isinstance(ex, errors.FloodWaitError):
+            if ex.seconds > cls.retry_max_delay:
+                raise ex
+            return ex.seconds
+        return min(cls.retry_base_delay * 2 ** attempt, cls.retry_max_delay)
+
+    @classmethod
+    async def get_messages_with_retries(
+        cls,
+        client: TelegramClient,
+        chat: Chat,
+        checkpoint: ChatCheckpoint,
+        parse_chats_pb_info: str,
+        profiler: JobProfiler,
+        **parse_kwargs,
+        ) -> None:
+
+        for attempt in range(cls.max_retries + 1):
+            if checkpoint.is_complete:
+                return
+            try:
+                await cls.get_messages_from_chat(
+                    client, chat.chat, checkpoint, parse_chats_pb_info, profiler, **parse_kwargs,
+                )
+                return
+            except cls.retry_exceptions as ex:
+                if attempt == cls.max_retries:
+                    raise
+                delay = cls.get_retry_delay(ex, attempt)
+                log_msg = (
+                    f'Ошибка при парсинге чата {chat.chat_username}, повтор {attempt + 1}/{cls.max_retries} '
+                    f'через {delay} сек с сообщения {checkpoint.fetched_count}, код ошибки: {ex}'
+                )
+                logging.warning(log_msg)
+                gr.Info(log_msg)
+                await asyncio.sleep(delay)
 
     @classmethod
     async def parse_chats(
         cls, 
         auth_state: AuthState,
-        chats_list: list[Chat],
+        chats_list: ChatRegistry,
         api_id: str,
         api_hash: str,
+        export_formats: Collection[str],
+        profile: bool,
         *parse_args,
         ) -> tuple[str, list[Path]]:
 
         cvs_paths = []
-        parse_result = ''
 
         if len(chats_list) == 0:
             return 'Список чатов для парсинга пустой', cvs_paths
+        if len(export_formats) == 0:
+            return 'Не выбраны форматы экспорта', cvs_paths
 
         client = ClientConnector.get_client(auth_state.get_session(), api_id, api_hash)
         validation_result = await Validator.validate_auth(client)
         if not validation_result.is_valid:
             return 'Клиент не авторизован', cvs_paths
 
+        try:
+            format_kwargs = await cls.get_format_kwargs(auth_state, api_id, api_hash, export_formats, client)
+        except Exception as ex:
+            await ClientConnector.disconnect(client)
+            return f'Ошибка при получении аккаунта для поискового индекса, код ошибки: {ex}', cvs_paths
+
         parse_kwargs = dict(zip(DEFAULT_PARSE_KWARGS.keys(), parse_args))
         progress = gr.Progress()
+        profiler = JobProfiler(enabled=JobProfiler.is_enabled(profile))
+        profiler.start()
+        loop = asyncio.get_running_loop()
+        job_stem = ResultsDir.path / f'telegram_job_{datetime.now():%Y%m%d_%H%M%S_%f}'
+        job_sink_group = SinkGroup.from_formats(export_formats, job_stem, scope='job', format_kwargs=format_kwargs)
+
+        chat_results = [''] * len(chats_list)
+        ChatCheckpoint.remove_expired()
+        checkpoints = []
+        export_queue = asyncio.Queue(maxsize=cls.export_queue_size)
+        exporter = asyncio.create_task(
+            cls.export_worker(export_queue, export_formats, chat_results, cvs_paths, profiler, job_sink_group),
+        )
+        try:
+            for i, chat in enumerate(chats_list, start=1):
+                parse_chats_pb_info = f'Parsing chats {i}/{len(chats_list)}'
+                checkpoint = ChatCheckpoint(chat.chat_id, parse_kwargs)
+                checkpoints.append(checkpoint)
+                try:
+                    with profiler.stage('fetch'):
+                        await cls.get_messages_with_retries(
+                            client, chat, checkpoint, parse_chats_pb_info, profiler, **parse_kwargs,
+                        )
+                    if checkpoint.row_count == 0:
+                        log_msg = f'Из чата {chat.chat_username} не было извлечено ни одного сообщения'
+                        chat_results[i - 1] = log_msg
+                        checkpoint.remove()
+                    else:
+                        await export_queue.put((i - 1, chat, checkpoint))
+                except Exception as ex:
+                    log_msg = f'Ошибка при парсинге чата {chat.chat_username}, код ошибки: {ex}'
+                    if checkpoint.row_count > 0:
+                        log_msg += (
+                            f', сохранено сообщений: {checkpoint.row_count}, '
+                            f'повторный запуск с теми же настройками продолжит парсинг с места остановки'
+                        )
+                    chat_results[i - 1] = log_msg
+
+                progress(i / len(chats_list), desc=parse_chats_pb_info)
+            await export_queue.put(None)
+            await exporter
+        finally:
+            exporter.cancel()
+            for checkpoint in checkpoints:
+                checkpoint.release()
+            try:
+                job_paths = await loop.run_in_executor(cls.export_executor, profiler.call, 'export', job_sink_group.close)
+            finally:
+                profile_path = profiler.stop()
+
+        if any(sink.rows_written for sink in job_sink_group.sinks):
+            cvs_paths.extend(job_paths)
+        parse_result = ''.join(log_msg + '\n' for log_msg in chat_results)
+        if profile_path is not None:
+            cvs_paths.append(profile_path)
+            parse_result += profiler.get_summary()
+        return parse_result, cvs_paths
 
-        for i, chat in enumerate(chats_list, start=1):
+    @staticmethod
+    async def get_format_kwargs(
+        auth_state: AuthState,
+        api_id: str,
+        api_hash: str,
+        export_formats: Collection[str],
+        client: TelegramClient | None = None,
+        ) -> dict[str, dict]:
+        '''Аргументы приемников, которые зависят от аккаунта: поисковый индекс у каждого аккаунта свой'''
+        if 'search_index' not in export_formats:
+            return {}
+        owner_id = await ClientConnector.get_user_id(auth_state, api_id, api_hash, client)
+        return {'search_index': {'filepath': SearchIndexSink.get_filepath(owner_id)}}
+
+    @classmethod
+    async def export_worker(
+        cls,
+        export_queue: asyncio.Queue,
+        export_formats: Collection[str],
+        chat_results: list[str],
+        export_paths: list[Path],
+        profiler: JobProfiler,
+        job_sink_group: SinkGroup,
+        ) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await export_queue.get()
+            if item is None:
+                break
+            i, chat, checkpoint = item
             try:
-                parse_chats_pb_info = f'Parsing chats {i}/{len(chats_list)}'
-                message_dicts = await cls.get_messages_from_chat(client, chat.chat, parse_chats_pb_info, **parse_kwargs)
-                if len(message_dicts) == 0:
-                    log_msg = f'Из чата {chat.chat_username} не было извлечено ни одного сообщения'
-                    parse_result += log_msg + '\n'
-                else:
-                    cvs_path = cls.messages_to_csv(message_dicts)
-                    cvs_paths.append(cvs_path)
-                    log_msg = f'Успешный парсинг чата {chat.chat_username}, кол-во сообщений: {len(message_dicts)}'
-                    parse_result += log_msg + '\n'
+                paths = await loop.run_in_executor(
+                    cls.export_executor, profiler.call, 'export',
+                    cls.export_checkpoint, checkpoint, export_formats, job_sink_group,
+                )
+                export_paths.extend(paths)
+                log_msg = f'Успешный парсинг чата {chat.chat_username}, кол-во сообщений: {checkpoint.row_count}'
+                if checkpoint.is_resumed:
+                    log_msg += (
+                        f', парсинг продолжен с частей от {checkpoint.created_at:%Y-%m-%d %H:%M} UTC, '
+                        f'сообщения из этих частей не обновлялись'
+                    )
+                for path in paths:
+                    if path.name.endswith(f'.{StatsSink.extension}'):
+                        log_msg += '\n' + ChatStats.read_summary(path)
             except Exception as ex:
-                log_msg = f'Ошибка при парсинге чата {chat.chat_username}, код ошибки: {ex}'
-                parse_result += log_msg + '\n'
+                log_msg = f'Ошибка при сохранении чата {chat.chat_username}, код ошибки: {ex}'
+            chat_results[i] = log_msg
 
-            progress(i / len(chats_list), desc=parse_chats_pb_info)
-        return parse_result, cvs_paths
+    @classmethod
+    def get_export_stem(cls, chat_name: str | None) -> Path:
+        return ResultsDir.path / f'telegram_history_{chat_name or ""}'
+
+    @classmethod
+    def export_messages(
+        cls,
+        message_dicts: Iterable[MESSAGE_DICT],
+        export_formats: Collection[str],
+        job_sink_group: SinkGroup | None = None,
+        stem: Path | None = None,
+        ) -> list[Path]:
+
+        if stem is None:
+            stem = cls.get_export_stem(message_dicts[0].get('chat_name'))
+        with SinkGroup.from_formats(export_formats, stem, scope='chat') as sink_group:
+            for message_dict in message_dicts:
+                sink_group.write(message_dict)
+                if job_sink_group is not None:
+                    job_sink_group.write(message_dict)
+        return sink_group.close()
+
+    @classmethod
+    def export_checkpoint(
+        cls,
+        checkpoint: ChatCheckpoint,
+        export_formats: Collection[str],
+        job_sink_group: SinkGroup | None = None,
+        ) -> list[Path]:
+        '''Сборка итоговых файлов чата из сохраненных частей, после успешной записи части удаляются'''
+        stem = cls.get_export_stem(checkpoint.chat_name)
+        paths = cls.export_messages(checkpoint.iter_messages(), export_formats, job_sink_group, stem)
+        checkpoint.remove()
+        return paths
 
     @classmethod
     def messages_to_csv(cls, message_dicts: Collection[MESSAGE_DICT]) -> Path:
-        df = pd.DataFrame.from_dict(message_dicts)
-        df['sender_id'] = df['sender_id'].astype('Int64')
-        chat_name = message_dicts[0].get('chat_name', '')
-        cvs_path = cls.parse_results_dir / f'telegram_history_{chat_name}.csv'
-        df.to_csv(cvs_path, index=False)
-        return cvs_path
+        stem = cls.get_export_stem(message_dicts[0].get('chat_name'))
+        with CsvSink.from_stem(stem) as sink:
+            sink.write_many(message_dicts)
+        return sink.filepath
 
     @classmethod
     def zip_files(cls, file_paths: Collection[Path]) -> Path:
-        zip_filepath = cls.parse_results_dir / 'parse_results_csv.zip'
+        zip_filepath = ResultsDir.path / 'parse_results.zip'
         with zipfile.ZipFile(zip_filepath, 'w') as zipf:
             for file_path in file_paths:
                 zipf.write(file_path, arcname=file_path)
         return zip_filepath
 
     @staticmethod
-    def get_chats_info(chats_list: list[Chat]) -> str:
+    def get_chats_info(chats_list: ChatRegistry) -> str:
         chats_info = ''
         for i, chat in enumerate(chats_list, start=1):
             chats_info += f'{i}: ' + chat.get_chat_info() + '\n'
@@ -210,7 +399,7 @@ class Parser:
         cls, 
         auth_state: AuthState,
         chats_usernames,
-        chats_list: list[Chat],
+        chats_list: ChatRegistry,
         api_id: str,
         api_hash: str,
         ) -> str:
@@ -225,11 +414,13 @@ class Parser:
 
         for chat_username in chats_usernames.split():
             try:
+                if chats_list.find(chat_username) is not None:
+                    log_msg = f'Чат {chat_username} уже есть в списке'
+                    gr.Info(log_msg)
+                    continue
                 telethon_chat = await cls.get_chat(client, chat_username.strip())
-                if not telethon_chat in chats_list:
-                    chat = Chat.from_telethon_chat(telethon_chat, chat_username)
-                    chats_list.append(chat)
-                else:
+                chat = Chat.from_telethon_chat(telethon_chat, chat_username)
+                if not chats_list.add(chat):
                     log_msg = f'Чат {chat_username} уже есть в списке'
                     gr.Info(log_msg)
             except Exception as ex:
@@ -238,4 +429,4 @@ class Parser:
         return cls.get_chats_info(chats_list)
 
 
-Parser.parse_results_dir.mkdir(exist_ok=True)
+ResultsDir.path.mkdir(exist_ok=True)
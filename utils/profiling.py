@@ -0,0 +1,248 @@
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Iterator
+
+from utils.sinks import ResultsDir
+
+
+class JobProfiler:
+    '''
+    Профилирование задачи парсинга по стадиям fetch / convert / export
+    Семплирующий профайлер снимает стеки всех потоков, находящихся внутри стадии,
+    поэтому учитывает и event loop, и потоки записи; tracemalloc дает пик памяти и места аллокаций
+    '''
+    env_var = 'PARSER_PROFILE'
+    profiles_dirname = 'profiles'
+    sample_interval = 0.005
+    top_n = 10
+    summary_top_n = 3
+    tracemalloc_frames = 10
+    ignored_files = {contextlib.__file__, __file__}
+    # tracemalloc общий на процесс: его включает первый активный профайлер и выключает последний
+    tracemalloc_lock = threading.Lock()
+    active_profilers: set['JobProfiler'] = set()
+    started_tracemalloc = False
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        # стек стадий каждого потока: [[имя стадии, время начала, память в начале], ...]
+        self.thread_stages: dict[int, list[list]] = {}
+        self.stages_lock = threading.Lock()
+        self.stage_times: dict[str, float] = defaultdict(float)
+        self.stage_allocated: dict[str, int] = defaultdict(int)
+        self.stage_peaks: dict[str, int] = defaultdict(int)
+        self.self_samples: dict[str, Counter] = defaultdict(Counter)
+        self.total_samples: dict[str, Counter] = defaultdict(Counter)
+        self.sample_counts: Counter = Counter()
+        # пик памяти процесса общий, при одновременных задачах он относится ко всем сразу
+        self.is_memory_shared = False
+        self.stop_event = threading.Event()
+        self.sampler: threading.Thread | None = None
+        self.report: dict[str, Any] | None = None
+
+    @classmethod
+    def is_enabled(cls, enabled: bool = False) -> bool:
+        return enabled or os.getenv(cls.env_var, '').lower() in ('1', 'true', 'yes')
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        self.started_at = time.perf_counter()
+        with self.tracemalloc_lock:
+            if not self.active_profilers:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(self.tracemalloc_frames)
+                    JobProfiler.started_tracemalloc = True
+                tracemalloc.reset_peak()
+            else:
+                self.is_memory_shared = True
+                for profiler in self.active_profilers:
+                    profiler.is_memory_shared = True
+            self.active_profilers.add(self)
+        self.sampler = threading.Thread(target=self.sample_loop, name='job-profiler', daemon=True)
+        self.sampler.start()
+
+    def stage(self, name: str) -> ContextManager:
+        if not self.enabled:
+            return nullcontext()
+        return self._stage(name)
+
+    @staticmethod
+    def get_traced_memory() -> int:
+        return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+    @contextmanager
+    def _stage(self, name: str) -> Iterator[None]:
+        # время стадий исключающее: на время вложенной стадии время родительской не идет
+        # память стадии включающая: прирост за время стадии и пик, замеченный семплером
+        memory = self.get_traced_memory()
+        with self.stages_lock:
+            stack = self.thread_stages.setdefault(threading.get_ident(), [])
+            now = time.perf_counter()
+            if stack:
+                self.stage_times[stack[-1][0]] += now - stack[-1][1]
+            stack.append([name, now, memory])
+            self.stage_peaks[name] = max(self.stage_peaks[name], memory)
+        try:
+            yield
+        finally:
+            memory = self.get_traced_memory()
+            with self.stages_lock:
+                now = time.perf_counter()
+                stage_name, started_at, started_memory = stack.pop()
+                self.stage_times[stage_name] += now - started_at
+                self.stage_allocated[stage_name] += memory - started_memory
+                self.stage_peaks[stage_name] = max(self.stage_peaks[stage_name], memory)
+                if stack:
+                    stack[-1][1] = now
+
+    def call(self, stage_name: str, fn: Callable, *args, **kwargs) -> Any:
+        with self.stage(stage_name):
+            return fn(*args, **kwargs)
+
+    def sample_loop(self) -> None:
+        while not self.stop_event.wait(self.sample_interval):
+            try:
+                self.take_samples()
+            except Exception as ex:
+                logging.error(f'Ошибка при семплировании профайлера, код ошибки: {ex}')
+
+    def take_samples(self) -> None:
+        frames = sys._current_frames()
+        memory = self.get_traced_memory()
+        with self.stages_lock:
+            # стеки меняются в других потоках, поэтому текущие стадии читаются под блокировкой
+            thread_stages = {
+                thread_id: [stage[0] for stage in stack]
+                for thread_id, stack in self.thread_stages.items() if stack
+            }
+            for stage_names in thread_stages.values():
+                for stage_name in stage_names:
+                    self.stage_peaks[stage_name] = max(self.stage_peaks[stage_name], memory)
+        for thread_id, stage_names in thread_stages.items():
+            if thread_id in frames:
+                self.add_sample(stage_names[-1], frames[thread_id])
+
+    def add_sample(self, stage_name: str, frame) -> None:
+        # кадры самого профайлера не считаются горячими точками
+        while frame is not None and frame.f_code.co_filename in self.ignored_files:
+            frame = frame.f_back
+        if frame is None:
+            return
+        code = frame.f_code
+        self.self_samples[stage_name][f'{Path(code.co_filename).name}:{frame.f_lineno} {code.co_name}'] += 1
+        functions = set()
+        while frame is not None:
+            code = frame.f_code
+            functions.add(f'{Path(code.co_filename).name}:{code.co_firstlineno} {code.co_name}')
+            frame = frame.f_back
+        self.total_samples[stage_name].update(functions)
+        self.sample_counts[stage_name] += 1
+
+    def get_top_allocations(self) -> list[dict[str, Any]]:
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        top_allocations = []
+        for stat in snapshot.statistics('lineno')[:self.top_n]:
+            frame = stat.traceback[0]
+            top_allocations.append({
+                'site': f'{frame.filename}:{frame.lineno}',
+                'size_kb': round(stat.size / 1024, 1),
+                'count': stat.count,
+            })
+        return top_allocations
+
+    def release_tracemalloc(self) -> None:
+        with self.tracemalloc_lock:
+            self.active_profilers.discard(self)
+            if not self.active_profilers and JobProfiler.started_tracemalloc:
+                tracemalloc.stop()
+                JobProfiler.started_tracemalloc = False
+
+    def stop(self) -> Path | None:
+        '''Остановка профилирования и сохранение отчета, ошибки профайлера не прерывают задачу парсинга'''
+        if not self.enabled:
+            return None
+        self.stop_event.set()
+        self.sampler.join()
+        try:
+            return self.save_report()
+        except Exception as ex:
+            logging.error(f'Ошибка при сохранении профиля, код ошибки: {ex}')
+            return None
+        finally:
+            self.release_tracemalloc()
+
+    def save_report(self) -> Path:
+        if tracemalloc.is_tracing():
+            current_memory, peak_memory = tracemalloc.get_traced_memory()
+            top_allocations = self.get_top_allocations()
+        else:
+            current_memory, peak_memory, top_allocations = 0, 0, []
+
+        stages = {}
+        for stage_name in dict.fromkeys([*self.stage_times, *self.sample_counts]):
+            sample_count = self.sample_counts[stage_name]
+            stages[stage_name] = {
+                'time_sec': round(self.stage_times[stage_name], 3),
+                'memory_allocated_mb': round(self.stage_allocated[stage_name] / 1024 ** 2, 2),
+                'memory_peak_mb': round(self.stage_peaks[stage_name] / 1024 ** 2, 2),
+                'samples': sample_count,
+                'top_self': [
+                    {'location': location, 'percent': round(100 * count / sample_count, 1)}
+                    for location, count in self.self_samples[stage_name].most_common(self.top_n)
+                ],
+                'top_total': [
+                    {'function': function, 'percent': round(100 * count / sample_count, 1)}
+                    for function, count in self.total_samples[stage_name].most_common(self.top_n)
+                ],
+            }
+        self.report = {
+            'wall_time_sec': round(time.perf_counter() - self.started_at, 3),
+            'sample_interval_sec': self.sample_interval,
+            'memory_peak_mb': round(peak_memory / 1024 ** 2, 2),
+            'memory_current_mb': round(current_memory / 1024 ** 2, 2),
+            'memory_shared_with_other_jobs': self.is_memory_shared,
+            'stages': stages,
+            'top_allocations': top_allocations,
+        }
+        profiles_dir = ResultsDir.path / self.profiles_dirname
+        profiles_dir.mkdir(parents=True, exist_ok=True)
+        profile_path = profiles_dir / f'profile_{datetime.now():%Y%m%d_%H%M%S_%f}.json'
+        with open(profile_path, 'w', encoding='utf-8') as file:
+            json.dump(self.report, file, ensure_ascii=False, indent=2)
+        return profile_path
+
+    def get_summary(self) -> str:
+        if self.report is None:
+            return ''
+        summary = (
+            f'Профилирование: общее время {self.report["wall_time_sec"]} сек, '
+            f'пик памяти {self.report["memory_peak_mb"]} МБ'
+            f'{" (общий с другими задачами)" if self.report["memory_shared_with_other_jobs"] else ""}\n'
+        )
+        for stage_name, stage in self.report['stages'].items():
+            hotspots = ', '.join(
+                f'{hotspot["location"]} ({hotspot["percent"]}%)'
+                for hotspot in stage['top_self'][:self.summary_top_n]
+            )
+            summary += (
+                f'{stage_name}: {stage["time_sec"]} сек, память +{stage["memory_allocated_mb"]} МБ '
+                f'(пик {stage["memory_peak_mb"]} МБ), горячие точки: {hotspots or "-"}\n'
+            )
+        if self.report['top_allocations']:
+            allocation = self.report['top_allocations'][0]
+            summary += f'Крупнейшая аллокация: {allocation["site"]} ({allocation["size_kb"]} КБ)\n'
+        return summary
@@ -0,0 +1,149 @@
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable
+
+
+@dataclass
+class SearchResult:
+    chat_id: int
+    chat_name: str | None
+    message_id: int | None
+    date: str
+    sender_id: int | None
+    sender_username: str | None
+    snippet: str
+    rank: float
+
+
+class SearchIndex:
+    '''Полнотекстовый индекс сообщений на основе SQLite FTS5, отдельный файл на каждый аккаунт Telegram'''
+    index_fields = ['chat_id', 'message_id', 'date', 'chat_name', 'sender_id', 'sender_username', 'text']
+    schema = '''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER,
+            date TEXT,
+            chat_name TEXT,
+            sender_id INTEGER,
+            sender_username TEXT,
+            text TEXT,
+            UNIQUE (chat_id, message_id)
+        );
+        CREATE INDEX IF NOT EXISTS messages_chat_date ON messages (chat_id, date);
+        CREATE INDEX IF NOT EXISTS messages_sender ON messages (sender_id);
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+            text,
+            content='messages',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+        CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+        END;
+    '''
+
+    def __init__(self, filepath: Path):
+        self.filepath = filepath
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.filepath, timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(self.schema)
+
+    @staticmethod
+    def to_index_date(date: datetime | float | str | None) -> str | None:
+        if date is None or isinstance(date, str):
+            return date
+        if isinstance(date, (int, float)):
+            date = datetime.fromtimestamp(date, tz=timezone.utc)
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+        return date.astimezone(timezone.utc).isoformat()
+
+    def add_messages(self, message_dicts: Iterable[dict]) -> None:
+        columns = ', '.join(self.index_fields)
+        placeholders = ', '.join(f':{field}' for field in self.index_fields)
+        updates = ', '.join(f'{field} = excluded.{field}' for field in self.index_fields[2:])
+        query = (
+            f'INSERT INTO messages ({columns}) VALUES ({placeholders}) '
+            f'ON CONFLICT (chat_id, message_id) DO UPDATE SET {updates}'
+        )
+        rows = []
+        for message_dict in message_dicts:
+            row = {field: message_dict.get(field) for field in self.index_fields}
+            row['date'] = self.to_index_date(row['date'])
+            rows.append(row)
+        with self.connection:
+            self.connection.executemany(query, rows)
+
+    @staticmethod
+    def to_match_query(query: str) -> str:
+        '''Обычный текст в запрос FTS5: каждое слово - термин в кавычках, * в конце слова - поиск по префиксу'''
+        terms = []
+        for word in query.split():
+            is_prefix = len(word) > 1 and word.endswith('*')
+            word = word.rstrip('*') if is_prefix else word
+            terms.append('"' + word.replace('"', '""') + '"' + ('*' if is_prefix else ''))
+        return ' '.join(terms)
+
+    def search(
+        self,
+        query: str,
+        raw_query: bool = False,
+        chat_id: int | None = None,
+        sender: int | str | None = None,
+        date_from: datetime | float | None = None,
+        date_to: datetime | float | None = None,
+        limit: int = 20,
+        ) -> list[SearchResult]:
+        '''raw_query=True - query передается в MATCH как есть, с синтаксисом FTS5 (OR, NOT, NEAR, колонки)'''
+        conditions = ['messages_fts MATCH :query']
+        params = dict(query=query if raw_query else self.to_match_query(query), limit=limit)
+        if chat_id is not None:
+            conditions.append('m.chat_id = :chat_id')
+            params['chat_id'] = chat_id
+        if sender is not None:
+            if isinstance(sender, int) or str(sender).lstrip('-').isdigit():
+                conditions.append('m.sender_id = :sender')
+                params['sender'] = int(sender)
+            else:
+                conditions.append('m.sender_username = :sender COLLATE NOCASE')
+                params['sender'] = str(sender).lstrip('@')
+        if date_from is not None:
+            conditions.append('m.date >= :date_from')
+            params['date_from'] = self.to_index_date(date_from)
+        if date_to is not None:
+            conditions.append('m.date <= :date_to')
+            params['date_to'] = self.to_index_date(date_to)
+
+        sql_query = f'''
+            SELECT
+                m.chat_id, m.chat_name, m.message_id, m.date, m.sender_id, m.sender_username,
+                snippet(messages_fts, 0, '[', ']', '…', 16),
+                bm25(messages_fts) AS rank
+            FROM messages_fts
+            JOIN messages AS m ON m.id = messages_fts.rowid
+            WHERE {' AND '.join(conditions)}
+            ORDER BY rank
+            LIMIT :limit
+        '''
+        rows = self.connection.execute(sql_query, params).fetchall()
+        return [SearchResult(*row) for row in rows]
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> 'SearchIndex':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -9,7 +9,8 @@ from datetime import datetime
 def setup_logging(log_to_file: bool, level: int, timezone: BaseTzInfo) -> None:
     '''Настройка логгирования под конкретный часовой пояс'''
     logging.Formatter.converter = lambda *args: datetime.now(tz=timezone).timetuple()
-    handlers = [logging.StreamHandler(sys.stdout)]
+    # stderr, чтобы stdout оставался только под вывод JSON Lines (формат stdout)
+    handlers = [logging.StreamHandler(sys.stderr)]
     
     if log_to_file:
         log_file_name = 'bot_log.log'
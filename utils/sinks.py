@@ -0,0 +1,422 @@
+import csv
+import gzip
+import importlib.util
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Collection, Iterable, TextIO
+
+from utils.search import SearchIndex
+from utils.stats import ChatStats
+
+
+MESSAGE_DICT = dict[str, str | int | datetime | None]
+MESSAGE_FIELDS = [
+    'date',
+    'chat_type',
+    'chat_name',
+    'chat_id',
+    'message_id',
+    'sender_type',
+    'sender_username',
+    'sender_first_name',
+    'sender_last_name',
+    'sender_id',
+    'text',
+    # время последнего редактирования, пусто у неотредактированных сообщений
+    'edit_date',
+]
+# поля с датой, в текстовых форматах хранятся в ISO 8601
+DATE_FIELDS = ['date', 'edit_date']
+
+
+class ResultsDir:
+    '''
+    Каталог результатов парсинга, от него строятся пути экспорта, частей чатов, профилей и поисковых индексов
+    Пути вычисляются при обращении, поэтому переназначение path переносит все результаты
+    '''
+    path = Path('parse_results_dir')
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class Sink(ABC):
+    '''Приемник строк сообщений с собственным буфером'''
+    extension: str = ''
+    # chat - отдельный приемник на каждый чат, job - один приемник на всю задачу парсинга
+    scope: str = 'chat'
+    # True - правки уже записанных сообщений live-режима приемнику не передаются
+    skip_edits: bool = False
+
+    def __init__(self, filepath: Path | None = None, buffer_size: int = 1000):
+        self.filepath = filepath
+        self.buffer_size = buffer_size
+        self.buffer: list[MESSAGE_DICT] = []
+        self.rows_written = 0
+        self.is_closed = False
+
+    @classmethod
+    def from_stem(cls, stem: Path, **kwargs) -> 'Sink':
+        return cls(stem.with_name(f'{stem.name}.{cls.extension}'), **kwargs)
+
+    def write(self, message_dict: MESSAGE_DICT) -> None:
+        self.buffer.append(message_dict)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def write_many(self, message_dicts: Iterable[MESSAGE_DICT]) -> None:
+        for message_dict in message_dicts:
+            self.write(message_dict)
+
+    def flush(self) -> None:
+        if self.buffer:
+            self._write_rows(self.buffer)
+            self.rows_written += len(self.buffer)
+            self.buffer = []
+
+    def close(self) -> Path | None:
+        if not self.is_closed:
+            self.flush()
+            self._close()
+            self.is_closed = True
+        return self.filepath
+
+    @property
+    def filepaths(self) -> list[Path]:
+        return [] if self.filepath is None else [self.filepath]
+
+    @abstractmethod
+    def _write_rows(self, message_dicts: list[MESSAGE_DICT]) -> None:
+        ...
+
+    def _close(self) -> None:
+        pass
+
+    def __enter__(self) -> 'Sink':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class CsvSink(Sink):
+    extension = 'csv'
+
+    def __init__(self, filepath: Path, buffer_size: int = 1000):
+        super().__init__(filepath, buffer_size)
+        self.file = open(filepath, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=MESSAGE_FIELDS, extrasaction='ignore', lineterminator='\n')
+        self.writer.writeheader()
+
+    def _write_rows(self, message_dicts: list[MESSAGE_DICT]) -> None:
+        self.writer.writerows(message_dicts)
+        self.file.flush()
+
+    def _close(self) -> None:
+        self.file.close()
+
+
+class JsonlGzSink(Sink):
+    extension = 'jsonl.gz'
+
+    def __init__(self, filepath: Path, buffer_size: int = 1000):
+        super().__init__(filepath, buffer_size)
+        self.file = gzip.open(filepath, 'wt', encoding='utf-8')
+
+    def _write_rows(self, message_dicts: list[MESSAGE_DICT]) -> None:
+        lines = [json.dumps(message_dict, ensure_ascii=False, default=_json_default) for message_dict in message_dicts]
+        self.file.write('\n'.join(lines) + '\n')
+
+    def _close(self) -> None:
+        self.file.close()
+
+
+class SqliteSink(Sink):
+    extension = 'sqlite'
+    table_name = 'messages'
+
+    def __init__(self, filepath: Path, buffer_size: int = 1000):
+        super().__init__(filepath, buffer_size)
+        filepath.unlink(missing_ok=True)
+        # live-режим создает приемник в потоке event loop, а пишет и закрывает его в потоках export_executor по очереди
+        self.connection = sqlite3.connect(filepath, check_same_thread=False)
+        columns = ', '.join(MESSAGE_FIELDS)
+        self.connection.execute(f'CREATE TABLE {self.table_name} ({columns})')
+        placeholders = ', '.join(f':{field}' for field in MESSAGE_FIELDS)
+        self.insert_query = f'INSERT INTO {self.table_name} ({columns}) VALUES ({placeholders})'
+
+    def _write_rows(self, message_dicts: list[MESSAGE_DICT]) -> None:
+        rows = [{field: message_dict.get(field) for field in MESSAGE_FIELDS} for message_dict in message_dicts]
+        for row in rows:
+            for field in DATE_FIELDS:
+                if isinstance(row[field], datetime):
+                    row[field] = row[field].isoformat()
+        with self.connection:
+            self.connection.executemany(self.insert_query, rows)
+
+    def _close(self) -> None:
+        self.connection.close()
+
+
+class ArrowSink(Sink):
+    '''Файл Arrow IPC, который загрузчик читает через memory map без копирования, требует pyarrow'''
+    extension = 'arrow'
+
+    def __init__(self, filepath: Path, buffer_size: int = 10000):
+        import pyarrow as pa
+
+        super().__init__(filepath, buffer_size)
+        string_fields = ['chat_type', 'chat_name', 'sender_type', 'sender_username', 'sender_first_name', 'sender_last_name', 'text']
+        int_fields = ['chat_id', 'message_id', 'sender_id']
+        fields = {field: pa.timestamp('us', tz='UTC') for field in DATE_FIELDS}
+        fields.update({field: pa.string() for field in string_fields})
+        fields.update({field: pa.int64() for field in int_fields})
+        self.schema = pa.schema([(field, fields[field]) for field in MESSAGE_FIELDS])
+        self.record_batch = pa.RecordBatch
+        self.writer = pa.ipc.new_file(str(filepath), self.schema)
+
+    def _write_rows(self, message_dicts: list[MESSAGE_DICT]) -> None:
+        columns = {field: [message_dict.get(field) for message_dict in message_dicts] for field in MESSAGE_FIELDS}
+        self.writer.write_batch(self.record_batch.from_pydict(columns, schema=self.schema))
+
+    def _close(self) -> None:
+        self.writer.close()
+
+
+class StdoutSink(Sink):
+    '''
+    Вывод строк в stdout в формате JSON Lines для передачи через pipe
+    Дескриптор stdout резервируется только под JSON Lines, остальной вывод процесса (print, баннер gradio) уходит в stderr
+    '''
+    # PARSER_STDOUT=1 - stdout резервируется при запуске приложения, иначе при создании первого приемника
+    env_var = 'PARSER_STDOUT'
+    # общий поток для всех приемников, строки одной порции не перемешиваются между задачами
+    stream: TextIO | None = None
+    stream_lock = threading.Lock()
+
+    def __init__(self, filepath: Path | None = None, buffer_size: int = 1000):
+        super().__init__(None, buffer_size)
+        self.reserve_stdout()
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return os.getenv(cls.env_var, '').lower() in ('1', 'true', 'yes')
+
+    @classmethod
+    def reserve_stdout(cls) -> TextIO:
+        '''Копия дескриптора stdout для JSON Lines, а сам дескриптор 1 перенаправляется в stderr'''
+        with cls.stream_lock:
+            if cls.stream is not None:
+                return cls.stream
+            try:
+                sys.stdout.flush()
+                stdout_fd = os.dup(sys.stdout.fileno())
+                os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+                cls.stream = os.fdopen(stdout_fd, 'w', encoding='utf-8')
+            except (AttributeError, OSError, ValueError):
+                # stdout без файлового дескриптора (например в Jupyter) - пишем в него как есть
+                cls.stream = sys.stdout
+            return cls.stream
+
+    @classmethod
+    def from_stem(cls, stem: Path, **kwargs) -> 'StdoutSink':
+        return cls(**kwargs)
+
+    def _write_rows(self, message_dicts: list[MESSAGE_DICT]) -> None:
+        lines = [json.dumps(message_dict, ensure_ascii=False, default=_json_default) + '\n' for message_dict in message_dicts]
+        with self.stream_lock:
+            self.stream.writelines(lines)
+            self.stream.flush()
+
+
+class SearchIndexSink(Sink):
+    '''
+    Пополнение полнотекстового индекса, файл индекса общий для всех чатов аккаунта
+    Путь к индексу передается через format_kwargs SinkGroup.from_formats, см. get_filepath
+    '''
+    scope = 'job'
+    search_dirname = 'search'
+
+    def __init__(self, filepath: Path | None = None, buffer_size: int = 1000):
+        if filepath is None:
+            raise ValueError('Для формата search_index не задан файл индекса аккаунта')
+        super().__init__(None, buffer_size)
+        self.search_index = SearchIndex(filepath)
+
+    @classmethod
+    def get_filepath(cls, owner_id: int) -> Path:
+        return ResultsDir.path / cls.search_dirname / f'{int(owner_id)}.sqlite'
+
+    @classmethod
+    def from_stem(cls, stem: Path, **kwargs) -> 'SearchIndexSink':
+        return cls(**kwargs)
+
+    def _write_rows(self, message_dicts: list[MESSAGE_DICT]) -> None:
+        self.search_index.add_messages(message_dicts)
+
+    def _close(self) -> None:
+        self.search_index.close()
+
+
+class StarSchemaSink(Sink):
+    '''
+    Нормализованный экспорт всей задачи: таблица фактов messages (только id, даты и текст)
+    и таблицы измерений chats и senders без повторов
+    '''
+    scope = 'job'
+    # edit_date отличает правку live-режима от исходного сообщения с тем же (message_id, chat_id)
+    fact_fields = ['message_id', 'chat_id', 'sender_id', 'date', 'text', 'edit_date']
+    chat_fields = ['chat_id', 'chat_type', 'chat_name']
+    sender_fields = ['sender_id', 'sender_type', 'sender_username', 'sender_first_name', 'sender_last_name']
+
+    def __init__(self, filepath: Path, buffer_size: int = 1000):
+        super().__init__(filepath, buffer_size)
+        self.chats_filepath = filepath.with_name(filepath.name.replace('_messages.csv', '_chats.csv'))
+        self.senders_filepath = filepath.with_name(filepath.name.replace('_messages.csv', '_senders.csv'))
+        self.chats: dict[int, MESSAGE_DICT] = {}
+        self.senders: dict[int, MESSAGE_DICT] = {}
+        self.file = open(filepath, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fact_fields, extrasaction='ignore', lineterminator='\n')
+        self.writer.writeheader()
+
+    @classmethod
+    def from_stem(cls, stem: Path, **kwargs) -> 'StarSchemaSink':
+        return cls(stem.with_name(f'{stem.name}_messages.csv'), **kwargs)
+
+    @property
+    def filepaths(self) -> list[Path]:
+        return [self.filepath, self.chats_filepath, self.senders_filepath]
+
+    def _write_rows(self, message_dicts: list[MESSAGE_DICT]) -> None:
+        for message_dict in message_dicts:
+            chat_id = message_dict['chat_id']
+            if chat_id not in self.chats:
+                self.chats[chat_id] = message_dict
+            sender_id = message_dict['sender_id']
+            if sender_id is not None and sender_id not in self.senders:
+                self.senders[sender_id] = message_dict
+        self.writer.writerows(message_dicts)
+        self.file.flush()
+
+    @staticmethod
+    def write_dimension(filepath: Path, fieldnames: list[str], rows: Iterable[MESSAGE_DICT]) -> None:
+        with open(filepath, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction='ignore', lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def _close(self) -> None:
+        self.file.close()
+        self.write_dimension(self.chats_filepath, self.chat_fields, self.chats.values())
+        self.write_dimension(self.senders_filepath, self.sender_fields, self.senders.values())
+
+
+class StatsSink(Sink):
+    '''Статистика чата, которая считается при записи и сохраняется рядом с экспортом в компактный JSON'''
+    extension = 'stats.json'
+    # правка не новое сообщение, иначе она учитывалась бы в статистике второй раз
+    skip_edits = True
+
+    def __init__(self, filepath: Path, buffer_size: int = 1000):
+        super().__init__(filepath, buffer_size)
+        self.stats = ChatStats()
+
+    def _write_rows(self, message_dicts: list[MESSAGE_DICT]) -> None:
+        for message_dict in message_dicts:
+            self.stats.update(message_dict)
+
+    def _close(self) -> None:
+        with open(self.filepath, 'w', encoding='utf-8') as file:
+            json.dump(self.stats.to_dict(), file, ensure_ascii=False)
+
+
+SINKS: dict[str, type[Sink]] = {
+    'csv': CsvSink,
+    'jsonl.gz': JsonlGzSink,
+    'sqlite': SqliteSink,
+    'stdout': StdoutSink,
+    'search_index': SearchIndexSink,
+    'star_schema': StarSchemaSink,
+    'stats': StatsSink,
+}
+if importlib.util.find_spec('pyarrow') is not None:
+    SINKS['arrow'] = ArrowSink
+DEFAULT_EXPORT_FORMATS = ['csv']
+
+
+class SinkGroup:
+    '''Раздача каждой строки во все приемники за один проход'''
+
+    def __init__(self, sinks: Collection[Sink]):
+        self.sinks = list(sinks)
+
+    @classmethod
+    def from_formats(
+        cls,
+        export_formats: Collection[str],
+        stem: Path,
+        scope: str | None = None,
+        format_kwargs: dict[str, dict] | None = None,
+        **kwargs,
+        ) -> 'SinkGroup':
+        '''format_kwargs - дополнительные аргументы приемников отдельных форматов, kwargs - аргументы всех приемников'''
+        format_kwargs = format_kwargs or {}
+        sinks = []
+        try:
+            for export_format in export_formats:
+                if export_format not in SINKS:
+                    raise ValueError(f'Неизвестный формат экспорта: {export_format}')
+                if scope is not None and SINKS[export_format].scope != scope:
+                    continue
+                sinks.append(SINKS[export_format].from_stem(stem, **kwargs, **format_kwargs.get(export_format, {})))
+        except Exception:
+            cls(sinks).close()
+            raise
+        return cls(sinks)
+
+    def write(self, message_dict: MESSAGE_DICT, is_edit: bool = False) -> None:
+        for sink in self.sinks:
+            if is_edit and sink.skip_edits:
+                continue
+            sink.write(message_dict)
+
+    def write_many(self, message_dicts: Iterable[MESSAGE_DICT]) -> None:
+        for message_dict in message_dicts:
+            self.write(message_dict)
+
+    def flush(self) -> None:
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self) -> list[Path]:
+        '''Закрываются все приемники, даже если один из них упал, после чего поднимается первая ошибка'''
+        filepaths = []
+        error: Exception | None = None
+        for sink in self.sinks:
+            try:
+                sink.close()
+                filepaths.extend(sink.filepaths)
+            except Exception as ex:
+                if error is None:
+                    error = ex
+                else:
+                    logging.error(f'Ошибка при закрытии приемника {type(sink).__name__}, код ошибки: {ex}')
+        if error is not None:
+            raise error
+        return filepaths
+
+    def __enter__(self) -> 'SinkGroup':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
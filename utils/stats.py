@@ -0,0 +1,146 @@
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+
+class ChatStats:
+    '''
+    Статистика чата, которая обновляется по мере записи сообщений, без повторного чтения датасета
+    Память не зависит от кол-ва сообщений: счетчики по дням, таблица Space-Saving для топа отправителей,
+    логарифмическая гистограмма длины текста и тепловая карта день недели x час (UTC)
+    '''
+    # размер таблицы счетчиков Space-Saving, топ точный пока отправителей в чате не больше этого числа
+    senders_capacity = 200
+    top_n = 10
+    weekdays = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+    def __init__(self):
+        self.chat_name: str | None = None
+        self.message_count = 0
+        self.first_date = None
+        self.last_date = None
+        self.day_counts: Counter = Counter()
+        # отправитель -> [кол-во сообщений, максимальная переоценка кол-ва]
+        self.sender_counters: dict[int | str, list[int]] = {}
+        self.sender_names: dict[int | str, str] = {}
+        # корзина k содержит длины от 2 ** (k - 1) до 2 ** k - 1, корзина 0 - пустой текст
+        self.length_buckets: Counter = Counter()
+        self.length_sum = 0
+        self.length_min: int | None = None
+        self.length_max = 0
+        self.heatmap = [[0] * 24 for _ in range(len(self.weekdays))]
+
+    def update(self, message_dict: dict) -> None:
+        if self.chat_name is None:
+            self.chat_name = message_dict.get('chat_name')
+        self.message_count += 1
+
+        date = message_dict['date']
+        if self.first_date is None or date < self.first_date:
+            self.first_date = date
+        if self.last_date is None or date > self.last_date:
+            self.last_date = date
+        self.day_counts[date.date().isoformat()] += 1
+        self.heatmap[date.weekday()][date.hour] += 1
+
+        sender_key = message_dict.get('sender_id') or message_dict.get('sender_username') or 'unknown'
+        self.update_sender(sender_key, message_dict)
+
+        length = len(message_dict.get('text') or '')
+        self.length_buckets[length.bit_length()] += 1
+        self.length_sum += length
+        self.length_min = length if self.length_min is None else min(self.length_min, length)
+        self.length_max = max(self.length_max, length)
+
+    def update_sender(self, sender_key: int | str, message_dict: dict) -> None:
+        if sender_key in self.sender_counters:
+            self.sender_counters[sender_key][0] += 1
+            return
+        if len(self.sender_counters) < self.senders_capacity:
+            self.sender_counters[sender_key] = [1, 0]
+        else:
+            # Space-Saving: новый отправитель вытесняет самый редкий и наследует его счетчик как оценку ошибки
+            min_key = min(self.sender_counters, key=lambda key: self.sender_counters[key][0])
+            min_count = self.sender_counters.pop(min_key)[0]
+            self.sender_names.pop(min_key, None)
+            self.sender_counters[sender_key] = [min_count + 1, min_count]
+        self.sender_names[sender_key] = self.get_sender_name(message_dict)
+
+    @staticmethod
+    def get_sender_name(message_dict: dict) -> str:
+        if message_dict.get('sender_username'):
+            return f'@{message_dict["sender_username"]}'
+        full_name = ' '.join(
+            name for name in (message_dict.get('sender_first_name'), message_dict.get('sender_last_name')) if name
+        )
+        return full_name or str(message_dict.get('sender_id'))
+
+    def get_length_quantile(self, quantile: float) -> int:
+        '''Оценка квантиля длины текста линейной интерполяцией внутри корзины гистограммы'''
+        threshold = quantile * self.message_count
+        cumulative_count = 0
+        for bucket in sorted(self.length_buckets):
+            bucket_count = self.length_buckets[bucket]
+            if cumulative_count + bucket_count >= threshold:
+                bucket_from = 2 ** (bucket - 1) if bucket else 0
+                bucket_to = min(2 ** bucket - 1, self.length_max)
+                share = (threshold - cumulative_count) / bucket_count
+                return round(bucket_from + share * (bucket_to - bucket_from))
+            cumulative_count += bucket_count
+        return self.length_max
+
+    def to_dict(self) -> dict[str, Any]:
+        top_senders = sorted(self.sender_counters.items(), key=lambda item: item[1][0], reverse=True)[:self.top_n]
+        stats = {
+            'chat_name': self.chat_name,
+            'message_count': self.message_count,
+            'first_date': self.first_date.isoformat() if self.first_date else None,
+            'last_date': self.last_date.isoformat() if self.last_date else None,
+            'day_counts': dict(sorted(self.day_counts.items())),
+            'top_senders': [
+                {'sender': sender_key, 'name': self.sender_names[sender_key], 'count': count, 'max_error': max_error}
+                for sender_key, (count, max_error) in top_senders
+            ],
+            'text_length': {
+                'mean': round(self.length_sum / self.message_count, 1) if self.message_count else 0,
+                'min': self.length_min or 0,
+                'max': self.length_max,
+                'p50': self.get_length_quantile(0.5),
+                'p90': self.get_length_quantile(0.9),
+                'p99': self.get_length_quantile(0.99),
+                'histogram': [
+                    {'from': 2 ** (bucket - 1) if bucket else 0, 'to': 2 ** bucket - 1, 'count': count}
+                    for bucket, count in sorted(self.length_buckets.items())
+                ],
+            },
+            'heatmap_utc': {weekday: hours for weekday, hours in zip(self.weekdays, self.heatmap)},
+        }
+        return stats
+
+    @staticmethod
+    def get_summary(stats: dict[str, Any]) -> str:
+        if stats['message_count'] == 0:
+            return f'Статистика {stats["chat_name"]}: сообщений нет'
+        busiest_day, busiest_day_count = max(stats['day_counts'].items(), key=lambda item: item[1])
+        senders = ', '.join(f'{sender["name"]} ({sender["count"]})' for sender in stats['top_senders'][:3])
+        peak_weekday, peak_hour, peak_count = max(
+            ((weekday, hour, count) for weekday, hours in stats['heatmap_utc'].items() for hour, count in enumerate(hours)),
+            key=lambda item: item[2],
+        )
+        text_length = stats['text_length']
+        summary = (
+            f'Статистика {stats["chat_name"]}: сообщений {stats["message_count"]}, '
+            f'период {stats["first_date"][:10]} - {stats["last_date"][:10]}, '
+            f'самый активный день {busiest_day} ({busiest_day_count})\n'
+            f'Топ отправителей: {senders}\n'
+            f'Длина текста: средняя {text_length["mean"]}, медиана ~{text_length["p50"]}, '
+            f'p90 ~{text_length["p90"]}, максимум {text_length["max"]}\n'
+            f'Пик активности (UTC): {peak_weekday} {peak_hour}:00, сообщений {peak_count}'
+        )
+        return summary
+
+    @classmethod
+    def read_summary(cls, stats_path: Path) -> str:
+        with open(stats_path, encoding='utf-8') as file:
+            return cls.get_summary(json.load(file))